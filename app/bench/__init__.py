@@ -0,0 +1 @@
+# Benchmarks: fake ERP, fake token verifier and load runner (python -m bench.run)
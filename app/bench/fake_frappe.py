@@ -0,0 +1,260 @@
+"""
+Stand-in Frappe/ERPNext server for benchmarks.
+
+Implements the subset of the Frappe REST API this service calls: login,
+DocType schemas, list/get/create/submit on /api/resource, get_count and
+generate_keys. Every response can be delayed (latency_ms + jitter_ms) and
+a fraction of them replaced by errors (error_rate, error_status).
+
+Run standalone with:
+    python -m bench.fake_frappe --port 8001 --latency-ms 20
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+BENCH_FORM = "Bench Farmer"
+
+SCHEMAS: Dict[str, Dict[str, Any]] = {
+    BENCH_FORM: {
+        "name": BENCH_FORM,
+        "module": "Bench",
+        "modified": "2025-01-01 00:00:00",
+        "is_submittable": 1,
+        "fields": [
+            {"fieldname": "farmer_name", "fieldtype": "Data", "label": "Farmer Name", "reqd": 1},
+            {"fieldname": "village", "fieldtype": "Link", "label": "Village", "options": "Village"},
+            {"fieldname": "gender", "fieldtype": "Select", "label": "Gender", "options": "Male\nFemale"},
+            {"fieldname": "acres", "fieldtype": "Float", "label": "Acres"},
+            {"fieldname": "details_section", "fieldtype": "Section Break", "label": "Details"},
+            {"fieldname": "crops", "fieldtype": "Table", "label": "Crops", "options": "Bench Crop"},
+        ],
+    },
+    "Bench Crop": {
+        "name": "Bench Crop",
+        "module": "Bench",
+        "modified": "2025-01-01 00:00:00",
+        "istable": 1,
+        "fields": [
+            {"fieldname": "crop", "fieldtype": "Data", "label": "Crop", "reqd": 1},
+            {"fieldname": "quantity", "fieldtype": "Int", "label": "Quantity"},
+        ],
+    },
+    "Village": {
+        "name": "Village",
+        "module": "Bench",
+        "modified": "2025-01-01 00:00:00",
+        "fields": [
+            {"fieldname": "village_name", "fieldtype": "Data", "label": "Village Name"},
+            {"fieldname": "district", "fieldtype": "Link", "label": "District", "options": "District"},
+        ],
+    },
+    "District": {
+        "name": "District",
+        "module": "Bench",
+        "modified": "2025-01-01 00:00:00",
+        "fields": [{"fieldname": "district_name", "fieldtype": "Data", "label": "District Name"}],
+    },
+}
+
+
+def _compare(op: str, actual: Any, expected: Any) -> bool:
+    if op == "=":
+        return actual == expected
+    if op == "!=":
+        return actual != expected
+    if op == "in":
+        return actual in expected
+    if op == "like":
+        return actual is not None and str(expected).strip("%").lower() in str(actual).lower()
+    if actual is None:
+        return False
+    if op == ">":
+        return actual > expected
+    if op == ">=":
+        return actual >= expected
+    if op == "<":
+        return actual < expected
+    if op == "<=":
+        return actual <= expected
+    return False
+
+
+def _parse_conditions(raw: str | None) -> List[tuple]:
+    # Each condition is [field, op, value] or [doctype, field, op, value]
+    return [tuple(condition[-3:]) for condition in json.loads(raw)] if raw else []
+
+
+def _apply_filters(rows: List[Dict[str, Any]], raw_filters: str | None,
+                   raw_or_filters: str | None = None) -> List[Dict[str, Any]]:
+    """Rows matching all filters and, if given, any of or_filters (as Frappe combines them)."""
+    conditions = _parse_conditions(raw_filters)
+    any_of = _parse_conditions(raw_or_filters)
+    return [
+        r for r in rows
+        if all(_compare(op, r.get(field), value) for field, op, value in conditions)
+        and (not any_of or any(_compare(op, r.get(field), value) for field, op, value in any_of))
+    ]
+
+
+def _sort(rows: List[Dict[str, Any]], order_by: str) -> List[Dict[str, Any]]:
+    # Stable sorts applied from the last key to the first, e.g. "modified asc, name asc"
+    for clause in reversed([c.strip() for c in order_by.split(",") if c.strip()]):
+        field, _, direction = clause.partition(" ")
+        rows = sorted(rows, key=lambda r: r.get(field) or "", reverse=direction.strip().lower() == "desc")
+    return rows
+
+
+def _project(row: Dict[str, Any], raw_fields: str | None) -> Dict[str, Any]:
+    if not raw_fields:
+        return {"name": row["name"]}
+    fields = json.loads(raw_fields) if raw_fields.startswith("[") else raw_fields.split(",")
+    fields = [f.strip().strip("`") for f in fields]
+    if "*" in fields:
+        return dict(row)
+    return {f: row.get(f) for f in fields}
+
+
+def create_fake_frappe(latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                       error_rate: float = 0.0, error_status: int = 503,
+                       villages: int = 2000, districts: int = 40,
+                       extra_doctypes: int = 500, seed: int | None = None) -> FastAPI:
+    """
+    Build the fake ERP app. Data is generated deterministically per instance.
+    """
+    app = FastAPI()
+    rng = random.Random(seed)
+    doc_counter = itertools.count(1)
+
+    docs: Dict[str, List[Dict[str, Any]]] = {
+        "District": [
+            {"name": f"D{i:03d}", "district_name": f"District {i}", "modified": "2025-01-01 00:00:00"}
+            for i in range(districts)
+        ],
+        "Village": [
+            {"name": f"V{i:05d}", "village_name": f"Village {i}", "district": f"D{i % districts:03d}",
+             "modified": f"2025-01-{1 + i % 28:02d} 00:00:00"}
+            for i in range(villages)
+        ],
+        "Deleted Document": [],
+    }
+    doctype_rows = [
+        {"name": name, "module": schema.get("module"), "modified": schema["modified"],
+         "istable": schema.get("istable", 0), "issingle": 0, "is_submittable": schema.get("is_submittable", 0)}
+        for name, schema in SCHEMAS.items()
+    ] + [
+        {"name": f"Bench DocType {i:04d}", "module": f"Module {i % 12}", "modified": "2025-01-01 00:00:00",
+         "istable": 0, "issingle": 0, "is_submittable": 0}
+        for i in range(extra_doctypes)
+    ]
+    docs["DocType"] = sorted(doctype_rows, key=lambda r: r["name"])
+
+    app.state.stats = {"requests": 0, "injected_errors": 0, "created": 0, "submitted": 0}
+    app.state.docs = docs
+
+    async def simulate():
+        """Apply configured latency; return an error response to inject, if any."""
+        app.state.stats["requests"] += 1
+        delay = latency_ms + (rng.uniform(0, jitter_ms) if jitter_ms else 0.0)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if error_rate and rng.random() < error_rate:
+            app.state.stats["injected_errors"] += 1
+            return JSONResponse(status_code=error_status, content={"exc_type": "BenchInjectedError"})
+        return None
+
+    @app.post("/api/method/login")
+    async def login():
+        if (error := await simulate()) is not None:
+            return error
+        response = JSONResponse({"message": "Logged In", "full_name": "Bench Admin"})
+        response.set_cookie("sid", f"bench-{rng.getrandbits(32):08x}")
+        return response
+
+    @app.get("/api/method/frappe.auth.get_logged_user")
+    async def get_logged_user():
+        if (error := await simulate()) is not None:
+            return error
+        return {"message": "bench-admin"}
+
+    @app.get("/api/method/frappe.client.get_count")
+    async def get_count(doctype: str, filters: str | None = None):
+        if (error := await simulate()) is not None:
+            return error
+        return {"message": len(_apply_filters(docs.get(doctype, []), filters))}
+
+    @app.post("/api/method/frappe.core.doctype.user.user.generate_keys")
+    async def generate_keys(request: Request):
+        if (error := await simulate()) is not None:
+            return error
+        body = await request.json()
+        return {"message": {"api_secret": f"secret-{body.get('user')}"}}
+
+    @app.get("/api/resource/{doctype}")
+    async def list_docs(doctype: str, request: Request):
+        if (error := await simulate()) is not None:
+            return error
+        q = request.query_params
+        rows = _apply_filters(docs.get(doctype, []), q.get("filters"), q.get("or_filters"))
+        if q.get("order_by"):
+            rows = _sort(rows, q["order_by"])
+        start = int(q.get("limit_start", 0))
+        length = int(q.get("limit_page_length", 20))
+        page = rows[start:] if length == 0 else rows[start:start + length]
+        return {"data": [_project(r, q.get("fields")) for r in page]}
+
+    @app.get("/api/resource/{doctype}/{name}")
+    async def get_doc(doctype: str, name: str):
+        if (error := await simulate()) is not None:
+            return error
+        if doctype == "DocType" and name in SCHEMAS:
+            return {"data": SCHEMAS[name]}
+        if doctype == "User":
+            return {"data": {"name": name, "email": name, "api_key": f"key-{name}"}}
+        for row in docs.get(doctype, []):
+            if row["name"] == name:
+                return {"data": row}
+        return JSONResponse(status_code=404, content={"exc_type": "DoesNotExistError"})
+
+    @app.post("/api/resource/{doctype}")
+    async def create_doc(doctype: str, request: Request):
+        if (error := await simulate()) is not None:
+            return error
+        body = await request.json()
+        app.state.stats["created"] += 1
+        return {"data": {**body, "name": f"{doctype}-{next(doc_counter):07d}", "docstatus": 0}}
+
+    @app.post("/api/resource/{doctype}/{name}")
+    async def run_doc_method(doctype: str, name: str, run_method: str | None = None):
+        if (error := await simulate()) is not None:
+            return error
+        if run_method == "submit":
+            app.state.stats["submitted"] += 1
+        return {"data": {"name": name, "doctype": doctype, "docstatus": 1}}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run a stand-in Frappe server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+    app = create_fake_frappe(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
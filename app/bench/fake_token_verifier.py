@@ -0,0 +1,36 @@
+"""
+Stand-in for GoogleTokenVerifier so benchmarks need no real Google tokens.
+"""
+from typing import Any, Dict
+
+from utils.google_token_verifier import TokenValidationError
+
+TOKEN_PREFIX = "bench-user-"
+
+
+def bench_token(user: int) -> str:
+    return f"{TOKEN_PREFIX}{user}"
+
+
+class FakeTokenVerifier:
+    """
+    Accepts tokens of the form "bench-user-<n>" and maps them to
+    user<n>@bench.local; anything else is rejected.
+    """
+
+    def __init__(self):
+        self.stats = {"hits": 0, "misses": 0}
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        if not token.startswith(TOKEN_PREFIX):
+            self.stats["misses"] += 1
+            raise TokenValidationError("Not a benchmark token")
+        self.stats["hits"] += 1
+        user = token[len(TOKEN_PREFIX):]
+        return {
+            "user_id": user,
+            "email": f"user{user}@bench.local",
+            "name": f"Bench User {user}",
+            "verified_email": True,
+            "expires_in": 3600,
+        }
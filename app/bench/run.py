@@ -0,0 +1,246 @@
+"""
+Load-test the service in-process against the fake ERP and token verifier.
+
+Each scenario is driven at each concurrency level and reported as
+requests/second and p50/p95/p99 latency. Results can be saved with
+--json and compared to a saved baseline with --baseline; a regression
+beyond --tolerance makes the run exit non-zero.
+
+    python -m bench.run
+    python -m bench.run --scenarios submit,doctype --concurrency 1,25,100 \\
+        --requests 1000 --latency-ms 25 --jitter-ms 10 --error-rate 0.01
+    python -m bench.run --json bench.json
+    python -m bench.run --baseline bench.json --tolerance 0.2
+
+The load generator shares the event loop with the app, so absolute numbers
+include client overhead; compare runs on the same machine.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+from urllib.parse import quote
+
+# Never let a benchmark reach a real ERP or touch the real credential store
+FAKE_ERP_BASE = "http://fake-frappe.bench"
+os.environ["API_BASE"] = FAKE_ERP_BASE
+os.environ["ERP_USER"] = "bench-admin"
+os.environ["ERP_PASS"] = "bench-admin"
+os.environ.setdefault("LOCAL_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+from bench.fake_frappe import BENCH_FORM, create_fake_frappe  # noqa: E402
+from bench.fake_token_verifier import FakeTokenVerifier, bench_token  # noqa: E402
+
+SCENARIOS = ("submit", "doctype", "link_options", "erp_status")
+
+Request = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def build_scenarios(schema_hash: str, users: int, run_id: str) -> Dict[str, Request]:
+    form_path = quote(BENCH_FORM)
+
+    def headers(i: int) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {bench_token(i % users)}"}
+
+    async def submit(client: httpx.AsyncClient, i: int):
+        item = {
+            "id": f"{run_id}-{i}",
+            "formName": BENCH_FORM,
+            "data": {"farmer_name": f"Farmer {i}", "village": f"V{i % 2000:05d}", "gender": "Female", "acres": 1.5},
+            "schemaHash": schema_hash,
+            "status": "pending",
+            "is_submittable": 1,
+        }
+        return await client.post("/submit", json=item, headers=headers(i))
+
+    async def doctype(client: httpx.AsyncClient, i: int):
+        return await client.get(f"/doctype/{form_path}", headers=headers(i))
+
+    async def link_options(client: httpx.AsyncClient, i: int):
+        return await client.get(
+            "/link-options/Village",
+            params={"filter_field": "district", "filter_value": f"D{i % 40:03d}"},
+            headers=headers(i),
+        )
+
+    async def erp_status(client: httpx.AsyncClient, i: int):
+        return await client.get("/user/erp-status", headers=headers(i))
+
+    return {"submit": submit, "doctype": doctype, "link_options": link_options, "erp_status": erp_status}
+
+
+async def run_level(client: httpx.AsyncClient, request: Request, concurrency: int,
+                    total: int, offset: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(offset, offset + total))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await request(client, i)
+                outcome = None if response.status_code < 400 else str(response.status_code)
+            except Exception as e:
+                outcome = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            if outcome is not None:
+                errors[outcome] = errors.get(outcome, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "error_breakdown": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+    }
+
+
+async def run_benchmark(args) -> List[Dict[str, Any]]:
+    import main
+    from middleware.auth_middleware import AuthMiddleware
+    from services.erp_client import erp_client
+
+    fake_erp = create_fake_frappe(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, error_status=args.error_status, seed=args.seed,
+    )
+    await erp_client.aclose()
+    erp_client.base_url = FAKE_ERP_BASE
+    erp_client.transport = httpx.ASGITransport(app=fake_erp)
+
+    # Swap in the fake verifier before the middleware stack is built
+    for middleware in main.app.user_middleware:
+        if middleware.cls is AuthMiddleware:
+            middleware.kwargs["token_verifier"] = FakeTokenVerifier()
+
+    results = []
+    run_id = f"bench-{int(time.time() * 1000)}"
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            hash_response = await client.get(
+                f"/doctype/{quote(BENCH_FORM)}/hash", headers={"Authorization": f"Bearer {bench_token(0)}"}
+            )
+            hash_response.raise_for_status()
+            schema_hash = hash_response.json()["schema_hash"]
+            scenarios = build_scenarios(schema_hash, args.users, run_id)
+
+            offset = 0
+            for name in args.scenarios:
+                request = scenarios[name]
+                # Unmeasured warm-up so caches and sessions are primed
+                await run_level(client, request, min(args.warmup, 10) or 1, args.warmup, offset)
+                offset += args.warmup
+                for concurrency in args.concurrency:
+                    result = await run_level(client, request, concurrency, args.requests, offset)
+                    offset += args.requests
+                    result["scenario"] = name
+                    results.append(result)
+                    print_result(result)
+    print(f"fake ERP: {fake_erp.state.stats}")
+    return results
+
+
+def print_header():
+    print(f"{'scenario':<14}{'conc':>6}{'reqs':>8}{'errors':>8}{'rps':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+
+
+def print_result(r: Dict[str, Any]):
+    print(f"{r['scenario']:<14}{r['concurrency']:>6}{r['requests']:>8}{r['errors']:>8}{r['rps']:>10.1f}"
+          f"{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['max_ms']:>10.2f}")
+
+
+def compare_to_baseline(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]],
+                        tolerance: float) -> List[str]:
+    """Return a description of every result that regressed beyond tolerance."""
+    previous = {(b["scenario"], b["concurrency"]): b for b in baseline}
+    regressions = []
+    for r in results:
+        b = previous.get((r["scenario"], r["concurrency"]))
+        if b is None:
+            continue
+        label = f"{r['scenario']} @ {r['concurrency']}"
+        if r["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {b['p95_ms']:.2f} -> {r['p95_ms']:.2f} ms")
+        if r["rps"] < b["rps"] * (1 - tolerance):
+            regressions.append(f"{label}: rps {b['rps']:.1f} -> {r['rps']:.1f}")
+        if r["errors"] > b["errors"]:
+            regressions.append(f"{label}: errors {b['errors']} -> {r['errors']}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the API against a fake ERP")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda s: [x.strip() for x in s.split(",") if x.strip()])
+    parser.add_argument("--concurrency", default="1,10,50",
+                        type=lambda s: [int(x) for x in s.split(",") if x.strip()])
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--users", type=int, default=20, help="distinct fake users to spread requests over")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="fake ERP latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake ERP calls that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    print_header()
+    results = asyncio.run(run_benchmark(args))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,48 @@
+import time
+# Taken before the other imports so the warm-up report includes import time
+PROCESS_STARTED = time.perf_counter()
+
 import os
+import asyncio
+import hmac
 import uvicorn
-from fastapi import FastAPI, HTTPException, Request
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any, Literal
-from services.fetchDoctype import fetch_doctype
-from services.fetch_all_doctype_names import fetch_all_doctype_names
+from typing import Dict, Any, List, Literal
+from services.doctype_cache import get_cached_doctype, doctype_cache
+from services.doctype_catalogue import doctype_catalogue, parse_catalogue_fields, DOCTYPE_CATALOGUE_MAX_LIMIT
 from services.send_submission_to_server import send_submission_to_server
-from services.login import user_exists_in_erp
-from services.create_schema_hash import create_schema_hash
+from services.login import user_exists_in_erp, get_user_erp_session, user_session_cache_snapshot, service_session_keeper
+from services.erp_client import erp_client
+from services.local_db import local_db
+from services.shared_state import shared_state
+from services.warmup import warmup
+from services.create_schema_hash import get_schema_hash
+from services.submission_validation import validate_submission
+from services.submission_outbox import submission_outbox, STATUS_SUBMITTED, STATUS_FAILED
+from services.submission_ledger import submission_ledger
 from middleware.auth_middleware import AuthMiddleware
+from middleware.compression_middleware import CompressionMiddleware
+from middleware.metrics_middleware import MetricsMiddleware
+from middleware.server_timing_middleware import ServerTimingMiddleware
 from utils.auth_utils import get_current_token, require_auth, get_current_user_info, get_current_user_email
-from services.fetch_link_options import fetch_link_options, fetch_link_options_count
+from utils.http_cache import conditional_json_response, make_etag, etag_matches, not_modified
+from utils.google_token_verifier import google_token_verifier
+from utils.metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from utils.request_timing import span
+from services.link_options_cache import link_options_cache
+from services.link_index import link_index
+from services.field_projection import parse_fields, validate_fields
+from services.form_bundle import build_form_bundle
+from services.fetch_link_options import (
+    fetch_link_options_page,
+    fetch_link_options_delta,
+    stream_link_options,
+    LINK_OPTIONS_MAX_PAGE_SIZE,
+)
 
 class SubmissionItem(BaseModel):
     id: str
@@ -21,7 +52,32 @@ class SubmissionItem(BaseModel):
     status: Literal['pending', 'submitted', 'failed']
     is_submittable: int
 
-app = FastAPI()
+class SubmissionBatch(BaseModel):
+    items: List[SubmissionItem]
+
+class LinkValues(BaseModel):
+    values: List[str]
+
+# Max number of concurrent ERP create/submit calls per batch request
+SUBMIT_BATCH_CONCURRENCY = int(os.environ.get("SUBMIT_BATCH_CONCURRENCY", 8))
+# Bearer token the Prometheus scraper sends; /metrics is disabled without one
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the local DB, log in and prefetch configured forms before serving
+    await warmup.run(process_started=PROCESS_STARTED)
+    await service_session_keeper.start()
+    await submission_outbox.start()
+    yield
+    await submission_outbox.stop()
+    await service_session_keeper.stop()
+    await warmup.stop()
+    # Close the pooled ERP connections on shutdown
+    await erp_client.aclose()
+    await local_db.close()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ["*"]
 
@@ -38,22 +94,39 @@ app.add_middleware(
 # If protected_routes is empty or None, all routes will be protected
 app.add_middleware(
     AuthMiddleware,
-    protected_routes=["/api", "/doctype", "/link-options", "/submit", "/user"],  # Only protect these routes
+    protected_routes=["/api", "/doctype", "/forms", "/link-options", "/submit", "/user"],  # Only protect these routes
     # protected_routes=None,  # Uncomment this line to protect ALL routes
     auth_header="Authorization",
     token_prefix="Bearer "
 )
 
+# Compress larger responses (brotli if installed, otherwise gzip)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.environ.get("COMPRESSION_MIN_SIZE", 1024)),
+)
+
+# Server-Timing header and slow-request log (REQUEST_TIMING_ENABLED, SLOW_REQUEST_THRESHOLD_MS)
+app.add_middleware(ServerTimingMiddleware)
+
+# Outermost, so recorded latency includes auth and compression
+app.add_middleware(MetricsMiddleware)
+
 ERP_SYSTEMS = [
     {"id": 1, "name": "CSA", "formCount": 3},
     {"id": 2, "name": "Sahaja Aharam", "formCount": 0},
     {"id": 3, "name": "FPO Hub", "formCount": 0},
 ]
 
+@app.get("/health", operation_id="get_health")
+async def get_health():
+    """Liveness check; also reports whether the startup warm-up has finished."""
+    return {"status": "ok", "warmup": warmup.snapshot()}
+
 @app.get("/user/erp-status", operation_id="get_erp_status")
 async def get_erp_status(request: Request):
     email = getattr(request.state, "user_email", None)
-    exists = user_exists_in_erp(email) if email else False
+    exists = await user_exists_in_erp(email) if email else False
     return {"erp_user": exists, "email": email}
 
 
@@ -61,34 +134,198 @@ async def get_erp_status(request: Request):
 async def get_erp_systems():
     return ERP_SYSTEMS
 
+@app.get("/api/cache-stats", operation_id="get_cache_stats")
+async def get_cache_stats():
+    return {
+        "doctype_schema": doctype_cache.snapshot(),
+        "submission_ledger": submission_ledger.stats,
+        "link_options": link_options_cache.snapshot(),
+        "erp_reads": erp_client.stats,
+        "user_sessions": user_session_cache_snapshot(),
+        "google_tokens": google_token_verifier.stats,
+        "shared_state": shared_state.stats,
+        "doctype_catalogue": doctype_catalogue.snapshot(),
+        "link_index": link_index.snapshot(),
+    }
+
+def _collect_cache_metrics():
+    """Expose cache hit/miss counts from the existing stats dicts at scrape time."""
+    ledger = submission_ledger.stats
+    link_options = link_options_cache.snapshot()
+    doctype_schema = doctype_cache.snapshot()
+    user_sessions = user_session_cache_snapshot()
+    caches = {
+        # cache: (hits, misses, entries)
+        "doctype_schema": (doctype_schema["hits"], doctype_schema["misses"] + doctype_schema["revalidations"], doctype_schema["size"]),
+        "link_options": (link_options["hits"] + link_options["stale_hits"], link_options["misses"], link_options["entries"]),
+        "submission_ledger": (ledger["joined_inflight"] + ledger["replayed"], ledger["executed"], None),
+        "erp_reads": (erp_client.stats["coalesced_reads"], erp_client.stats["reads"] - erp_client.stats["coalesced_reads"], None),
+        "user_sessions": (user_sessions["hits"], user_sessions["misses"], user_sessions["size"]),
+        "google_tokens": (google_token_verifier.stats["hits"], google_token_verifier.stats["misses"], None),
+    }
+    hits, misses, ratios, entries = [], [], [], []
+    for cache, (hit, miss, size) in caches.items():
+        labels = {"cache": cache}
+        hits.append((labels, hit))
+        misses.append((labels, miss))
+        ratios.append((labels, hit / (hit + miss) if hit + miss else 0.0))
+        if size is not None:
+            entries.append((labels, size))
+    return [
+        ("cache_hits_total", "counter", "Lookups served from a cache", hits),
+        ("cache_misses_total", "counter", "Lookups that had to go to ERP", misses),
+        ("cache_hit_ratio", "gauge", "Fraction of lookups served from a cache", ratios),
+        ("cache_entries", "gauge", "Entries currently held in a cache", entries),
+    ]
+
+metrics.register_collector(_collect_cache_metrics)
+# Only DocTypes that exist get their own ERP latency series
+erp_client.known_doctype = doctype_catalogue.contains
+
+@app.get("/metrics", operation_id="get_metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """Prometheus scrape endpoint, protected by METRICS_TOKEN."""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = request.headers.get("authorization", "").removeprefix("Bearer ")
+    if not hmac.compare_digest(supplied.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(
+            status_code=401,
+            detail={
+                'success': False,
+                'error': 'Unauthorized',
+                'message': 'A valid metrics token is required',
+            },
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return PlainTextResponse(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/doctype/{form_name}", operation_id="get_doctype_by_name")
-def get_doctype(form_name: str):
-    data = fetch_doctype(form_name)
-    return {"data": data}
+async def get_doctype(form_name: str, request: Request):
+    data = await get_cached_doctype(form_name)
+    # The schema version identifies the body, so a 304 skips serialization entirely
+    etag = make_etag(form_name, data.get("modified"), get_schema_hash(data))
+    return conditional_json_response(request, {"data": data}, etag=etag)
+
+@app.get("/doctype/{form_name}/hash", operation_id="get_doctype_hash")
+async def get_doctype_hash(form_name: str, request: Request):
+    """Lightweight staleness check: returns only the schema hash for a DocType."""
+    data = await get_cached_doctype(form_name)
+    schema_hash = get_schema_hash(data)
+    return conditional_json_response(
+        request,
+        {
+            "form_name": form_name,
+            "schema_hash": schema_hash,
+            "modified": data.get("modified"),
+        },
+        etag=make_etag(form_name, data.get("modified"), schema_hash),
+    )
 
 @app.get("/doctype", operation_id="get_all_doctypes")
-def get_all_doctypes():
-    data = fetch_all_doctype_names(limit_start=0, limit_page_length=1000)
-    return {"data": data}
+async def get_all_doctypes(
+    request: Request,
+    fields: str | None = None,
+    q: str | None = Query(None, description="Case-insensitive name search; prefix matches are listed first"),
+    module: str | None = Query(None, description="Only DocTypes of this module"),
+    limit: int | None = Query(None, ge=1, le=DOCTYPE_CATALOGUE_MAX_LIMIT, description="Page size; all matches when omitted"),
+    offset: int = Query(0, ge=0),
+):
+    """Search the in-memory DocType catalogue."""
+    projected = parse_catalogue_fields(parse_fields(fields))
+    await doctype_catalogue.ensure_loaded()
+    # Derived from the catalogue contents, so every worker agrees on it
+    etag = make_etag("doctype-catalogue", doctype_catalogue.content_digest, q, module, limit, offset, *projected)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    rows, total = doctype_catalogue.search(q=q, module=module, limit=limit, offset=offset)
+    next_offset = offset + len(rows)
+    return conditional_json_response(
+        request,
+        {
+            "data": [{f: row.get(f) for f in projected} for row in rows],
+            "total": total,
+            "next_offset": next_offset if next_offset < total else None,
+        },
+        etag=etag,
+    )
+
+@app.get("/forms/{form_name}/bundle", operation_id="get_form_bundle")
+async def get_form_bundle(form_name: str, request: Request):
+    """Schema, schema hash and all Link-field options for a form in one request."""
+    bundle = await build_form_bundle(form_name)
+    return conditional_json_response(request, bundle)
 
 @app.get("/link-options/{linked_doctype}/count", operation_id="get_link_options_count")
-def get_link_options_count(
+async def get_link_options_count(
     linked_doctype: str,
     filter_field: str | None = None,
     filter_value: str | None = None,
 ):
     """Get the total count of records for a linked_doctype."""
-    result = fetch_link_options_count(linked_doctype, filter_field=filter_field, filter_value=filter_value)
-    return result
+    total_count = await link_options_cache.get_count(linked_doctype, filter_field=filter_field, filter_value=filter_value)
+    return {"total_count": total_count}
+
+@app.post("/link-options/{linked_doctype}/validate", operation_id="validate_link_values")
+async def validate_link_values(linked_doctype: str, body: LinkValues):
+    """
+    Bulk check which values are names of existing linked_doctype records,
+    answered from the in-memory membership index. exact is false when the
+    index is a Bloom filter, in which case a valid value may rarely be missing in ERP.
+    """
+    return await link_index.check(linked_doctype, body.values)
 
 @app.get("/link-options/{linked_doctype}", operation_id="get_link_options")
-def get_link_options(
+async def get_link_options(
     linked_doctype: str,
+    request: Request,
     filter_field: str | None = None,
     filter_value: str | None = None,
+    cursor: str | None = None,
+    page_size: int | None = Query(None, ge=1, le=LINK_OPTIONS_MAX_PAGE_SIZE),
+    since: str | None = None,
+    fields: str | None = None,
 ):
-    data = fetch_link_options(linked_doctype, filter_field=filter_field, filter_value=filter_value)
-    return {"data": data}
+    """
+    fields=a,b limits the returned columns (validated against the DocType schema).
+    Without cursor/page_size the full list is returned from the server-side cache.
+    With cursor or page_size a single page and its next_cursor are returned.
+    With `Accept: application/x-ndjson` every record (after cursor, if given)
+    is streamed, one per line.
+    With since=<timestamp> only records changed since then, deleted names and
+    a new watermark are returned.
+    """
+    projected = await validate_fields(linked_doctype, parse_fields(fields))
+    if since is not None:
+        return await fetch_link_options_delta(
+            linked_doctype,
+            since,
+            filter_field=filter_field,
+            filter_value=filter_value,
+            fields=projected,
+        )
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            stream_link_options(linked_doctype, filter_field, filter_value, page_size, fields=projected, cursor=cursor),
+            media_type="application/x-ndjson",
+        )
+    if cursor is not None or page_size is not None:
+        page = await fetch_link_options_page(
+            linked_doctype,
+            filter_field=filter_field,
+            filter_value=filter_value,
+            cursor=cursor,
+            page_size=page_size,
+            fields=projected,
+        )
+        return conditional_json_response(request, page)
+    data = await link_options_cache.get_options(
+        linked_doctype,
+        filter_field=filter_field,
+        filter_value=filter_value,
+        fields=projected,
+    )
+    return conditional_json_response(request, {"data": data})
 
 #for postman testing
 # @app.post("/submit/{form_name}")
@@ -96,32 +333,83 @@ def get_link_options(
 #     response = await send_submission_to_server(form_name, data)
 #     return response
 
-@app.post("/submit", operation_id="submit_form_data")
-async def submit_single_form(submission_item: SubmissionItem, request: Request):
-    try:
-        # getting the doctype
-        doctype_data = fetch_doctype(submission_item.formName)
-        # creating the hash from the server schema
-        latest_schema_hash = create_schema_hash(doctype_data)
-
-        if latest_schema_hash != submission_item.schemaHash:
-            raise HTTPException(
-                status_code=400,
-                detail={
-                    'success': False,
-                    'error': 'Schema hash mismatch',
-                    'message': 'The form schema has been updated. Please refresh and resubmit.',
-                    'latest_schema_hash': latest_schema_hash,
-                    'schemaHash': submission_item.schemaHash
-                }
-            )
-        user_email = getattr(request.state, "user_email", None)
-        response = await send_submission_to_server(
+def _check_schema_hash(submission_item: SubmissionItem, latest_schema_hash: str):
+    if latest_schema_hash != submission_item.schemaHash:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                'success': False,
+                'error': 'Schema hash mismatch',
+                'message': 'The form schema has been updated. Please refresh and resubmit.',
+                'latest_schema_hash': latest_schema_hash,
+                'schemaHash': submission_item.schemaHash
+            }
+        )
+
+async def _validate_item(submission_item: SubmissionItem, doctype_data: Dict[str, Any], latest_schema_hash: str):
+    """Schema hash and local data checks, so bad items never reach ERP."""
+    _check_schema_hash(submission_item, latest_schema_hash)
+    with span("validate"):
+        await validate_submission(submission_item.formName, doctype_data, submission_item.data)
+
+def _accepted_result(submission_item: SubmissionItem, accepted: Dict[str, Any]) -> Dict[str, Any]:
+    """Response for an id that was already accepted: replay it if delivered, otherwise 409."""
+    if accepted['status'] == STATUS_SUBMITTED:
+        return {
+            'success': True,
+            'message': 'Form submitted successfully',
+            'form_name': submission_item.formName,
+            'submission_id': submission_item.id,
+            'data': submission_item.data,
+            'server_response': accepted['server_response'],
+            'replayed': True,
+        }
+    raise HTTPException(
+        status_code=409,
+        detail={
+            'success': False,
+            'error': 'Submission in progress',
+            'message': 'This submission is already being delivered. Poll its status instead of resubmitting.',
+            'submission_id': submission_item.id,
+            'status': accepted['status'],
+            'status_url': f"/submit/{submission_item.id}",
+        }
+    )
+
+async def _submit_item(submission_item: SubmissionItem, doctype_data: Dict[str, Any], latest_schema_hash: str,
+                       user_email: str | None, use_user_session: bool = True):
+    """use_user_session=False sends with the service account (the caller already saw the per-user session fail)."""
+    async def submit():
+        # The outbox records every accepted id, sync or async and on any worker,
+        # so an id is only sent to ERP again if its earlier delivery failed
+        accepted = await submission_outbox.get_status(submission_item.id, user_email=user_email)
+        if accepted is not None and accepted['status'] != STATUS_FAILED:
+            return _accepted_result(submission_item, accepted)
+        await _validate_item(submission_item, doctype_data, latest_schema_hash)
+        accepted, claimed = await submission_outbox.claim(
+            submission_item.id,
             submission_item.formName,
             submission_item.is_submittable,
             submission_item.data,
             user_email=user_email,
         )
+        if not claimed:
+            return _accepted_result(submission_item, accepted)
+
+        try:
+            response = await send_submission_to_server(
+                submission_item.formName,
+                submission_item.is_submittable,
+                submission_item.data,
+                user_email=user_email if use_user_session else None,
+            )
+        except HTTPException as e:
+            await submission_outbox.record_result(submission_item.id, error=e.detail)
+            raise
+        except Exception as e:
+            await submission_outbox.record_result(submission_item.id, error={'success': False, 'error': str(e)})
+            raise
+        await submission_outbox.record_result(submission_item.id, response=response)
         return {
             'success': True,
             'message': 'Form submitted successfully',
@@ -130,6 +418,53 @@ async def submit_single_form(submission_item: SubmissionItem, request: Request):
             'data': submission_item.data,
             'server_response': response
         }
+
+    # Concurrent retries of the same id in this process join the first attempt
+    result, replayed = await submission_ledger.run((user_email, submission_item.id), submit)
+    return {**result, 'replayed': True} if replayed else result
+
+async def _enqueue_item(submission_item: SubmissionItem, doctype_data: Dict[str, Any], latest_schema_hash: str,
+                        user_email: str | None):
+    """Validate the item, then hand it to the outbox for background delivery."""
+    await _validate_item(submission_item, doctype_data, latest_schema_hash)
+    with span("enqueue"):
+        status = await submission_outbox.enqueue(
+            submission_item.id,
+            submission_item.formName,
+            submission_item.is_submittable,
+            submission_item.data,
+            user_email=user_email,
+        )
+    return JSONResponse(
+        status_code=202,
+        content={
+            'success': True,
+            'message': 'Form accepted for delivery',
+            'form_name': submission_item.formName,
+            'submission_id': submission_item.id,
+            'status': status['status'],
+            'status_url': f"/submit/{submission_item.id}",
+        },
+    )
+
+@app.post("/submit", operation_id="submit_form_data")
+async def submit_single_form(
+    submission_item: SubmissionItem,
+    request: Request,
+    mode: Literal['sync', 'async'] = 'sync',
+):
+    try:
+        # getting the doctype
+        with span("doctype"):
+            doctype_data = await get_cached_doctype(submission_item.formName)
+        # creating the hash from the server schema
+        with span("schema_hash"):
+            latest_schema_hash = get_schema_hash(doctype_data)
+
+        user_email = getattr(request.state, "user_email", None)
+        if mode == 'async':
+            return await _enqueue_item(submission_item, doctype_data, latest_schema_hash, user_email)
+        return await _submit_item(submission_item, doctype_data, latest_schema_hash, user_email)
         
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -145,6 +480,88 @@ async def submit_single_form(submission_item: SubmissionItem, request: Request):
             }
         )
 
+@app.post("/submit/batch", operation_id="submit_form_data_batch")
+async def submit_batch(batch: SubmissionBatch, request: Request):
+    """
+    Submit many queued items at once.
+    Each distinct form schema is fetched and hashed once, ERP calls run
+    concurrently (bounded by SUBMIT_BATCH_CONCURRENCY) and results are
+    returned per item in input order.
+    """
+    user_email = getattr(request.state, "user_email", None)
+
+    form_names = list(dict.fromkeys(item.formName for item in batch.items))
+    with span("doctype"):
+        schemas = await asyncio.gather(
+            *(get_cached_doctype(name) for name in form_names), return_exceptions=True
+        )
+    schemas = dict(zip(form_names, schemas))
+    with span("schema_hash"):
+        latest_hashes = {
+            name: schema if isinstance(schema, Exception) else get_schema_hash(schema)
+            for name, schema in schemas.items()
+        }
+
+    use_user_session = bool(user_email)
+    if user_email:
+        # Provision the per-user ERP session once rather than once per item;
+        # if that fails, every item falls back to the service account
+        try:
+            await get_user_erp_session(user_email)
+        except Exception as e:
+            print(f"[ERP] Per-user session failed for {user_email}: {e}. Submitting batch with the service account.")
+            use_user_session = False
+
+    semaphore = asyncio.Semaphore(SUBMIT_BATCH_CONCURRENCY)
+
+    async def run(submission_item: SubmissionItem):
+        latest_schema_hash = latest_hashes[submission_item.formName]
+        async with semaphore:
+            try:
+                if isinstance(latest_schema_hash, Exception):
+                    raise latest_schema_hash
+                return await _submit_item(
+                    submission_item, schemas[submission_item.formName], latest_schema_hash, user_email,
+                    use_user_session=use_user_session,
+                )
+            except HTTPException as e:
+                status_code, error = e.status_code, e.detail
+            except Exception as e:
+                status_code = 500
+                error = {'success': False, 'error': 'Internal server error', 'message': str(e)}
+        return {
+            'success': False,
+            'form_name': submission_item.formName,
+            'submission_id': submission_item.id,
+            'status_code': status_code,
+            'error': error,
+        }
+
+    results = await asyncio.gather(*(run(item) for item in batch.items))
+    failed = sum(1 for r in results if not r['success'])
+    return {
+        'success': failed == 0,
+        'submitted': len(results) - failed,
+        'failed': failed,
+        'results': results,
+    }
+
+@app.get("/submit/{submission_id}", operation_id="get_submission_status")
+async def get_submission_status(submission_id: str, request: Request):
+    """Poll the delivery status of a submission queued with mode=async."""
+    user_email = getattr(request.state, "user_email", None)
+    status = await submission_outbox.get_status(submission_id, user_email=user_email)
+    if status is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                'success': False,
+                'error': 'Submission not found',
+                'submission_id': submission_id,
+            }
+        )
+    return status
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
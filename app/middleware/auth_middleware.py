@@ -1,23 +1,39 @@
-from fastapi import Request, HTTPException
+import time
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
 from typing import List, Optional
-import os
+from utils.metrics import metrics
+from utils.request_timing import span
+from utils.google_token_verifier import GoogleTokenVerifier, TokenValidationError, google_token_verifier
 
+# Paths that never require authentication (health checks, docs)
+SKIP_PATHS = frozenset(["/docs", "/redoc", "/openapi.json", "/health"])
 
-class AuthMiddleware(BaseHTTPMiddleware):
+TOKEN_VERIFY_SECONDS = metrics.histogram(
+    "auth_token_verify_duration_seconds", "Google token verification latency", ("result",)
+)
+
+
+class AuthMiddleware:
     """
     Middleware to check for authorization token in headers.
     Can be configured to protect specific routes or all routes.
+
+    Implemented as plain ASGI so responses (including streaming ones) pass
+    through untouched; the validated user is stored on the request scope.
     """
     
     def __init__(self, app, protected_routes: Optional[List[str]] = None, 
                  auth_header: str = "Authorization", 
-                 token_prefix: str = "Bearer "):
-        super().__init__(app)
+                 token_prefix: str = "Bearer ",
+                 token_verifier: Optional[GoogleTokenVerifier] = None):
+        self.app = app
         self.protected_routes = protected_routes or []
         self.auth_header = auth_header
         self.token_prefix = token_prefix
+        self.token_verifier = token_verifier or google_token_verifier
+        # Precomputed once: str.startswith with a tuple checks all prefixes in one call
+        self._protected_prefixes = tuple(sorted(set(self.protected_routes), key=len, reverse=True))
+        self._auth_header_key = auth_header.lower().encode("latin-1")
     
     
     def _is_protected_route(self, path: str) -> bool:
@@ -25,20 +41,19 @@ class AuthMiddleware(BaseHTTPMiddleware):
         Check if the current route is protected.
         If no protected routes are specified, all routes are protected.
         """
-        if not self.protected_routes:
+        if not self._protected_prefixes:
             return True
-        
-        # Check if the path matches any protected route pattern
-        for route in self.protected_routes:
-            if path.startswith(route):
-                return True
-        return False
+        return path.startswith(self._protected_prefixes)
     
-    def _extract_token(self, request: Request) -> Optional[str]:
+    def _extract_token(self, scope) -> Optional[str]:
         """
         Extract token from the authorization header.
         """
-        auth_header = request.headers.get(self.auth_header)
+        auth_header = None
+        for key, value in scope.get("headers") or []:
+            if key == self._auth_header_key:
+                auth_header = value.decode("latin-1")
+                break
         if not auth_header:
             return None
         
@@ -48,61 +63,38 @@ class AuthMiddleware(BaseHTTPMiddleware):
     
     async def _validate_google_oauth_token(self, token: str) -> dict:
         """
-        Validate Google OAuth JWT token by calling Google's tokeninfo endpoint.
-        This ensures proper signature validation and token authenticity.
+        Validate Google OAuth JWT token locally.
+        Signature, issuer, audience and expiry are checked against Google's
+        cached signing keys; validated tokens are cached until they expire.
         """
         try:
-            import httpx
-            import json
-            
-            # Use Google's tokeninfo endpoint for proper validation
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"https://oauth2.googleapis.com/tokeninfo?id_token={token}",
-                    timeout=10.0
-                )
-                
-                if response.status_code == 200:
-                    token_info = response.json()
-                    user_info = {
-                        "user_id": token_info.get("sub"),
-                        "email": token_info.get("email"),
-                        "name": token_info.get("name"),
-                        "picture": token_info.get("picture"),
-                        "verified_email": token_info.get("email_verified"),
-                        "audience": token_info.get("aud"),
-                        "expires_in": token_info.get("expires_in"),
-                        "issued_at": token_info.get("iat")
-                    }
-                    
-                    return user_info
-                else:
-                    print(f"Token validation failed with status: {response.status_code}")
-                    return None
-                    
+            return await self.token_verifier.verify(token)
+        except TokenValidationError as e:
+            print(f"Token validation failed: {e}")
+            return None
         except Exception as e:
             print(f"Error validating Google OAuth token: {e}")
             return None
     
     
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope, receive, send):
         """
         Main middleware logic that runs before each request.
         """
-        # Skip authentication for certain paths (like health checks, docs)
-        skip_paths = ["/docs", "/redoc", "/openapi.json", "/health"]
-        if request.url.path in skip_paths:
-            return await call_next(request)
-        
-        # Check if this route is protected
-        if not self._is_protected_route(request.url.path):
-            return await call_next(request)
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        if path in SKIP_PATHS or not self._is_protected_route(path):
+            await self.app(scope, receive, send)
+            return
         
         # Extract token from headers
-        token = self._extract_token(request)
+        token = self._extract_token(scope)
         
         if not token:
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=401,
                 content={
                     "success": False,
@@ -110,11 +102,16 @@ class AuthMiddleware(BaseHTTPMiddleware):
                     "message": f"Please provide a valid {self.auth_header} header"
                 }
             )
+            await response(scope, receive, send)
+            return
         
         # Validate Google OAuth token
-        user_info = await self._validate_google_oauth_token(token)
+        started = time.perf_counter()
+        with span("auth"):
+            user_info = await self._validate_google_oauth_token(token)
+        TOKEN_VERIFY_SECONDS.observe(time.perf_counter() - started, "valid" if user_info else "invalid")
         if not user_info:
-            return JSONResponse(
+            response = JSONResponse(
                 status_code=401,
                 content={
                     "success": False,
@@ -122,15 +119,18 @@ class AuthMiddleware(BaseHTTPMiddleware):
                     "message": "The provided Google OAuth token is not valid or has expired"
                 }
             )
+            await response(scope, receive, send)
+            return
         
-        # Add token and user info to request state for use in route handlers
-        request.state.auth_token = token
-        request.state.user_info = user_info
-        request.state.user_id = user_info.get("user_id")
-        request.state.user_email = user_info.get("email")
-        request.state.user_name = user_info.get("name")
+        # Add token and user info to the scope; request.state reads from
+        # scope["state"], so route handlers see the same attributes as before
+        scope["user"] = user_info
+        state = scope.setdefault("state", {})
+        state["auth_token"] = token
+        state["user_info"] = user_info
+        state["user_id"] = user_info.get("user_id")
+        state["user_email"] = user_info.get("email")
+        state["user_name"] = user_info.get("name")
         
         # Continue to the next middleware/route handler
-        response = await call_next(request)
-        return response
-
+        await self.app(scope, receive, send)
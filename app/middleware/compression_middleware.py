@@ -0,0 +1,165 @@
+import gzip
+import zlib
+from typing import List, Optional
+from utils.http_cache import encoded_etag
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+def _add_vary(headers: List[tuple]) -> List[tuple]:
+    """Add Accept-Encoding to the Vary header, keeping what is already there."""
+    existing = [v.decode("latin-1") for k, v in headers if k.lower() == b"vary"]
+    values = [v.strip() for header in existing for v in header.split(",") if v.strip()]
+    if "*" in values or any(v.lower() == "accept-encoding" for v in values):
+        return headers
+    raw = [(k, v) for k, v in headers if k.lower() != b"vary"]
+    raw.append((b"vary", ", ".join([*values, "Accept-Encoding"]).encode("latin-1")))
+    return raw
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses response bodies with brotli or gzip,
+    negotiated from the Accept-Encoding header.
+    Bodies smaller than minimum_size are sent as-is. Streaming responses
+    (no Content-Length) are compressed incrementally from the first chunk
+    and flushed per chunk so clients still receive data as it is produced.
+    Every negotiable response carries Vary: Accept-Encoding, and a
+    compressed response's ETag gets an encoding suffix (e.g. "...-gzip")
+    so it never shares a strong ETag with the identity body.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_encoding(self, accept_encoding: str) -> Optional[str]:
+        accepted = set()
+        for part in accept_encoding.split(","):
+            coding, _, params = part.strip().partition(";")
+            if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                continue
+            accepted.add(coding.strip().lower())
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _compress(self, encoding: str, body: bytes) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    def _stream_compressor(self, encoding: str):
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            return (lambda chunk: compressor.process(chunk) + compressor.flush()), compressor.finish
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+        return (lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        encoding = self._choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if_none_match = headers.get(b"if-none-match", b"").decode("latin-1")
+
+        start_message = None
+        buffer = bytearray()
+        compress_chunk = finish = None
+        passthrough = False
+
+        def _with_vary(message):
+            return {**message, "headers": _add_vary(list(message.get("headers", [])))}
+
+        def _with_headers(message, length: Optional[int] = None):
+            raw: List[tuple] = []
+            for k, v in message.get("headers", []):
+                if k.lower() == b"content-length":
+                    continue
+                if k.lower() == b"etag":
+                    v = encoded_etag(v.decode("latin-1"), encoding).encode("latin-1")
+                raw.append((k, v))
+            raw.append((b"content-encoding", encoding.encode("ascii")))
+            if length is not None:
+                raw.append((b"content-length", str(length).encode("ascii")))
+            return {**message, "headers": _add_vary(raw)}
+
+        def _not_modified(message):
+            # Echo the encoded tag the client revalidated with, so it keeps matching its copy
+            raw = []
+            for k, v in message.get("headers", []):
+                if k.lower() == b"etag" and encoding is not None:
+                    tag = encoded_etag(v.decode("latin-1"), encoding)
+                    candidates = [c.strip().removeprefix("W/") for c in if_none_match.split(",")]
+                    if tag != v.decode("latin-1") and tag in candidates:
+                        v = tag.encode("latin-1")
+                raw.append((k, v))
+            return {**message, "headers": _add_vary(raw)}
+
+        async def _start_stream():
+            nonlocal compress_chunk, finish
+            compress_chunk, finish = self._stream_compressor(encoding)
+            await send(_with_headers(start_message))
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+
+            if message["type"] == "http.response.start":
+                response_headers = {k.lower(): v for k, v in message.get("headers", [])}
+                if message["status"] == 304:
+                    passthrough = True
+                    await send(_not_modified(message))
+                elif b"content-encoding" in response_headers or message["status"] == 204:
+                    # Already encoded (or bodiless) responses are left alone
+                    passthrough = True
+                    await send(message)
+                elif encoding is None or scope.get("method") == "HEAD" or (
+                    b"content-length" in response_headers
+                    and int(response_headers[b"content-length"]) < self.minimum_size
+                ):
+                    passthrough = True
+                    await send(_with_vary(message))
+                elif b"content-length" not in response_headers:
+                    # Streaming: compress from the first chunk rather than wait for minimum_size
+                    start_message = message
+                    await _start_stream()
+                else:
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compress_chunk is not None:
+                chunk = compress_chunk(body) if body else b""
+                if not more_body:
+                    chunk += finish()
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                return
+
+            # Known length of at least minimum_size: compress it in one piece
+            buffer.extend(body)
+            if not more_body:
+                compressed = self._compress(encoding, bytes(buffer))
+                await send(_with_headers(start_message, length=len(compressed)))
+                await send({"type": "http.response.body", "body": compressed})
+            elif len(buffer) >= self.minimum_size:
+                # Sent in several parts: compress incrementally from here on
+                await _start_stream()
+                await send({"type": "http.response.body", "body": compress_chunk(bytes(buffer)), "more_body": True})
+                buffer.clear()
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,54 @@
+import json
+from utils.request_timing import (
+    REQUEST_TIMING_ENABLED,
+    SLOW_REQUEST_THRESHOLD_MS,
+    start_request_timing,
+    end_request_timing,
+)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that times each request's stages.
+    Spans finished before the response starts are sent in a Server-Timing
+    header; requests slower than slow_threshold_ms are logged with all
+    their spans as one JSON line.
+    """
+
+    def __init__(self, app, enabled: bool = REQUEST_TIMING_ENABLED,
+                 slow_threshold_ms: float = SLOW_REQUEST_THRESHOLD_MS):
+        self.app = app
+        self.enabled = enabled
+        self.slow_threshold_ms = slow_threshold_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        timings, token = start_request_timing()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end_request_timing(token)
+            duration_ms = timings.elapsed_ms()
+            if self.slow_threshold_ms and duration_ms >= self.slow_threshold_ms:
+                print(json.dumps({
+                    "event": "slow_request",
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "duration_ms": round(duration_ms, 1),
+                    "spans": [[name, round(duration, 1)] for name, duration in timings.spans],
+                }))
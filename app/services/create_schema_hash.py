@@ -1,6 +1,8 @@
 import hashlib
+import os
 import re
-from typing import Dict, Any, List, Tuple
+from collections import Counter, OrderedDict
+from typing import Dict, Any, Mapping, Tuple
 
 LAYOUT_FIELD_TYPES = {
     "Section Break",
@@ -8,12 +10,21 @@ LAYOUT_FIELD_TYPES = {
     "HTML"
 }
 
-def normalize_fieldname(name: str, all_names: List[str]) -> str:
+SCHEMA_HASH_INDEX_MAX_ENTRIES = int(os.getenv("SCHEMA_HASH_INDEX_MAX_ENTRIES", "512"))
+
+_TRAILING_DIGITS = re.compile(r"\d+$")
+
+# (doctype name, modified) -> schema hash
+_schema_hash_index: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+
+
+def normalize_fieldname(name: str, name_counts: Mapping[str, int]) -> str:
     """
     Remove trailing digits ONLY if base name is unique.
+    name_counts maps each fieldname in the schema to its number of occurrences.
     """
-    base = re.sub(r"\d+$", "", name)
-    if base != name and all_names.count(base) == 1:
+    base = _TRAILING_DIGITS.sub("", name)
+    if base != name and name_counts.get(base, 0) == 1:
         return base
     return name
 
@@ -39,8 +50,8 @@ def normalize_options(fieldtype: str, options: Any) -> str:
 def create_schema_hash(doctype_schema: Dict[str, Any]) -> str:
     fields = doctype_schema.get("fields", [])
 
-    # Collect all fieldnames first
-    all_names = [f.get("fieldname", "") for f in fields]
+    # Count all fieldnames once so normalization stays linear in field count
+    name_counts = Counter(f.get("fieldname", "") for f in fields)
 
     simplified_fields = []
 
@@ -52,7 +63,7 @@ def create_schema_hash(doctype_schema: Dict[str, Any]) -> str:
         if fieldtype in LAYOUT_FIELD_TYPES:
             continue
 
-        normalized_name = normalize_fieldname(fieldname, all_names)
+        normalized_name = normalize_fieldname(fieldname, name_counts)
         normalized_options = normalize_options(
             fieldtype, field.get("options", "")
         )
@@ -78,3 +89,26 @@ def create_schema_hash(doctype_schema: Dict[str, Any]) -> str:
     ).hexdigest()
 
     return schema_hash
+
+
+def get_schema_hash(doctype_schema: Dict[str, Any]) -> str:
+    """
+    Return the schema hash, computed once per (doctype, modified) version.
+    Schemas without a name or `modified` timestamp are hashed directly.
+    """
+    name = doctype_schema.get("name")
+    modified = doctype_schema.get("modified")
+    if not name or not modified:
+        return create_schema_hash(doctype_schema)
+
+    key = (name, str(modified))
+    schema_hash = _schema_hash_index.get(key)
+    if schema_hash is not None:
+        _schema_hash_index.move_to_end(key)
+        return schema_hash
+
+    schema_hash = create_schema_hash(doctype_schema)
+    _schema_hash_index[key] = schema_hash
+    while len(_schema_hash_index) > SCHEMA_HASH_INDEX_MAX_ENTRIES:
+        _schema_hash_index.popitem(last=False)
+    return schema_hash
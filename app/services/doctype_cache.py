@@ -0,0 +1,122 @@
+"""
+In-process DocType schema cache.
+
+Entries are kept in LRU order and bounded in size. Once an entry is older
+than the TTL it is revalidated by comparing the DocType's `modified`
+timestamp with ERP and only re-downloaded when that has changed.
+Concurrent lookups of one DocType share a single load within the process,
+and fetched and revalidated schemas are published to the shared state
+store, so other workers reuse them instead of asking ERP again.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from utils.settings import load_settings
+from .fetchDoctype import fetch_doctype, fetch_doctype_modified
+from .shared_state import shared_state
+
+load_settings()
+
+DOCTYPE_CACHE_MAX_ENTRIES = int(os.getenv("DOCTYPE_CACHE_MAX_ENTRIES", "256"))
+DOCTYPE_CACHE_TTL = float(os.getenv("DOCTYPE_CACHE_TTL", "60"))
+
+SHARED_NAMESPACE = "doctype_schema"
+
+
+class DoctypeSchemaCache:
+    """
+    LRU cache of DocType schemas keyed by doctype name.
+    """
+
+    def __init__(self, max_entries: int = DOCTYPE_CACHE_MAX_ENTRIES, ttl: float = DOCTYPE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # name -> (schema, checked_at)
+        self._entries: "OrderedDict[str, tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "revalidations": 0,
+            "refreshes": 0,
+            "evictions": 0,
+        }
+
+    def _put(self, form_name: str, schema: Dict[str, Any]):
+        self._entries[form_name] = (schema, time.monotonic())
+        self._entries.move_to_end(form_name)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def get(self, form_name: str) -> Dict[str, Any]:
+        entry = self._entries.get(form_name)
+        if entry is None:
+            self.stats["misses"] += 1
+            stale = None
+        else:
+            stale, checked_at = entry
+            self._entries.move_to_end(form_name)
+            if time.monotonic() - checked_at < self.ttl:
+                self.stats["hits"] += 1
+                return stale
+            self.stats["revalidations"] += 1
+
+        return await asyncio.shield(self._start_load(form_name, stale))
+
+    async def _load_shared(self, form_name: str, stale: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        schema = await shared_state.get_or_refresh(
+            SHARED_NAMESPACE, form_name,
+            lambda previous: self._load(form_name, previous or stale),
+            ttl=self.ttl,
+        )
+        self._put(form_name, schema)
+        return schema
+
+    def _start_load(self, form_name: str, stale: Optional[Dict[str, Any]]) -> asyncio.Task:
+        # One load per DocType in this process; only that load takes the cross-worker lease
+        task = self._loading.get(form_name)
+        if task is None:
+            task = asyncio.ensure_future(self._load_shared(form_name, stale))
+            self._loading[form_name] = task
+            task.add_done_callback(lambda t: self._on_load_done(form_name, t))
+        return task
+
+    def _on_load_done(self, form_name: str, task: asyncio.Task):
+        self._loading.pop(form_name, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[DoctypeCache] Failed to load {form_name}: {task.exception()}")
+
+    async def _load(self, form_name: str, previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if previous is not None:
+            # Stale: cheap `modified` check before re-downloading the whole schema
+            modified = await fetch_doctype_modified(form_name)
+            if modified is not None and modified == previous.get("modified"):
+                return previous
+            self.stats["refreshes"] += 1
+        return await fetch_doctype(form_name)
+
+    def invalidate(self, form_name: str | None = None):
+        if form_name is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(form_name, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["revalidations"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hit_rate": (self.stats["hits"] / lookups) if lookups else 0.0,
+        }
+
+
+doctype_cache = DoctypeSchemaCache()
+
+
+async def get_cached_doctype(form_name: str) -> Dict[str, Any]:
+    """Returns a DocType schema from the cache, fetching or revalidating as needed."""
+    return await doctype_cache.get(form_name)
@@ -0,0 +1,226 @@
+"""
+In-memory catalogue of DocTypes for search.
+
+The full list is loaded with parallel paged ERP requests, then kept
+current with incremental refreshes (rows modified since the last
+watermark, plus deletions). Searches are answered from a sorted in-memory
+index: prefix matches by binary search, then substring matches, with
+optional module filtering and pagination.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from utils.settings import load_settings
+from .login import erp_service_request
+from .fetch_link_options import get_doctype_count, fetch_link_options_delta
+
+load_settings()
+
+DOCTYPE_CATALOGUE_PAGE_SIZE = int(os.getenv("DOCTYPE_CATALOGUE_PAGE_SIZE", "500"))
+DOCTYPE_CATALOGUE_CONCURRENCY = int(os.getenv("DOCTYPE_CATALOGUE_CONCURRENCY", "4"))
+# Seconds between incremental refreshes; the current catalogue is served meanwhile
+DOCTYPE_CATALOGUE_REFRESH_INTERVAL = float(os.getenv("DOCTYPE_CATALOGUE_REFRESH_INTERVAL", "300"))
+DOCTYPE_CATALOGUE_MAX_LIMIT = int(os.getenv("DOCTYPE_CATALOGUE_MAX_LIMIT", "1000"))
+
+DOCTYPE_ENDPOINT = "/api/resource/DocType"
+
+# Columns kept for every DocType; searches can project any of these
+CATALOGUE_FIELDS = ("name", "module", "modified", "istable", "issingle", "is_submittable")
+DEFAULT_FIELDS = ("name", "module")
+
+
+async def _fetch_page(limit_start: int, page_size: int) -> List[Dict[str, Any]]:
+    response = await erp_service_request(
+        "GET",
+        DOCTYPE_ENDPOINT,
+        params={
+            "fields": json.dumps(list(CATALOGUE_FIELDS)),
+            "order_by": "name asc",
+            "limit_start": limit_start,
+            "limit_page_length": page_size,
+        },
+    )
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"Failed to fetch DocTypes: {response.text}",
+        )
+    return response.json().get("data") or []
+
+
+class DoctypeCatalogue:
+    """
+    Searchable DocType list, loaded once and refreshed incrementally.
+    """
+
+    def __init__(self, page_size: int = DOCTYPE_CATALOGUE_PAGE_SIZE,
+                 concurrency: int = DOCTYPE_CATALOGUE_CONCURRENCY,
+                 refresh_interval: float = DOCTYPE_CATALOGUE_REFRESH_INTERVAL):
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.refresh_interval = refresh_interval
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        # Index: rows sorted by case-folded name, with the keys alongside for bisect
+        self._sorted: List[Dict[str, Any]] = []
+        self._keys: List[str] = []
+        self._by_module: Dict[str, List[int]] = {}
+        self.watermark: Optional[str] = None
+        # Digest of the indexed rows; equal on every worker holding the same catalogue
+        self.content_digest = ""
+        self._refreshed_at: Optional[float] = None
+        self._loading: Optional[asyncio.Task] = None
+        self.stats = {"full_loads": 0, "refreshes": 0, "refresh_failures": 0, "searches": 0}
+
+    def _index(self):
+        self._sorted = sorted(self._rows.values(), key=lambda r: r["name"].casefold())
+        self._keys = [r["name"].casefold() for r in self._sorted]
+        self._by_module = {}
+        for i, row in enumerate(self._sorted):
+            self._by_module.setdefault(str(row.get("module") or "").casefold(), []).append(i)
+        digest = hashlib.sha256(str(len(self._sorted)).encode("utf-8"))
+        for row in self._sorted:
+            digest.update(json.dumps([row.get(f) for f in CATALOGUE_FIELDS], default=str).encode("utf-8"))
+        self.content_digest = digest.hexdigest()
+
+    def _advance_watermark(self, rows: List[Dict[str, Any]]):
+        stamps = [str(r["modified"]) for r in rows if r.get("modified")]
+        if self.watermark:
+            stamps.append(self.watermark)
+        if stamps:
+            self.watermark = max(stamps)
+
+    async def _full_load(self):
+        # The count is only a hint for how many pages to fetch in parallel;
+        # a full last page means there is more, so keep paging from there
+        count = await get_doctype_count("DocType")
+        pages = max(1, math.ceil(count / self.page_size))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(page: int):
+            async with semaphore:
+                return await _fetch_page(page * self.page_size, self.page_size)
+
+        results = await asyncio.gather(*(fetch(page) for page in range(pages)))
+        rows = [row for page in results for row in page]
+        start = pages * self.page_size
+        last = results[-1]
+        while len(last) == self.page_size:
+            last = await _fetch_page(start, self.page_size)
+            rows.extend(last)
+            start += self.page_size
+
+        self._rows = {row["name"]: row for row in rows}
+        self.watermark = None
+        self._advance_watermark(rows)
+        self._index()
+        self.stats["full_loads"] += 1
+
+    async def _refresh(self):
+        delta = await fetch_link_options_delta("DocType", self.watermark, fields=list(CATALOGUE_FIELDS))
+        for row in delta["data"]:
+            self._rows[row["name"]] = row
+        for name in delta["deleted"]:
+            self._rows.pop(name, None)
+        if delta["data"] or delta["deleted"]:
+            self._index()
+        self.watermark = delta["watermark"]
+        self.stats["refreshes"] += 1
+
+    async def _load(self):
+        try:
+            if self._refreshed_at is None or self.watermark is None:
+                await self._full_load()
+            else:
+                await self._refresh()
+        except Exception:
+            if self._refreshed_at is not None:
+                self.stats["refresh_failures"] += 1
+            raise
+        self._refreshed_at = time.monotonic()
+
+    def _start_load(self) -> asyncio.Task:
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load())
+            self._loading.add_done_callback(self._on_load_done)
+        return self._loading
+
+    def _on_load_done(self, task: asyncio.Task):
+        self._loading = None
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[DoctypeCatalogue] Load failed: {task.exception()}")
+
+    async def ensure_loaded(self):
+        """Load on first use; afterwards refresh in the background when due."""
+        if self._refreshed_at is None:
+            await asyncio.shield(self._start_load())
+        elif time.monotonic() - self._refreshed_at > self.refresh_interval:
+            self._start_load()
+
+    def contains(self, name: str) -> bool:
+        return name in self._rows
+
+    def search(self, q: str | None = None, module: str | None = None,
+               limit: int | None = None, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Returns (page of matching rows, total matches).
+        Name-prefix matches come first, then other substring matches;
+        each group is in name order.
+        """
+        self.stats["searches"] += 1
+        if module:
+            positions = self._by_module.get(module.casefold(), [])
+        else:
+            positions = None
+
+        if q:
+            needle = q.casefold()
+            if positions is None:
+                lo = bisect.bisect_left(self._keys, needle)
+                hi = bisect.bisect_left(self._keys, needle + "\U0010ffff")
+                prefix = list(range(lo, hi))
+                rest = [i for i, key in enumerate(self._keys) if needle in key and not key.startswith(needle)]
+            else:
+                prefix = [i for i in positions if self._keys[i].startswith(needle)]
+                rest = [i for i in positions if needle in self._keys[i] and not self._keys[i].startswith(needle)]
+            positions = prefix + rest
+        elif positions is None:
+            positions = range(len(self._sorted))
+
+        total = len(positions)
+        end = total if limit is None else offset + limit
+        return [self._sorted[i] for i in positions[offset:end]], total
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "doctypes": len(self._rows),
+            "watermark": self.watermark,
+            "content_digest": self.content_digest,
+        }
+
+
+def parse_catalogue_fields(fields: List[str] | None) -> List[str]:
+    """Validates a fields projection against the columns the catalogue keeps."""
+    if not fields:
+        return list(DEFAULT_FIELDS)
+    unknown = [f for f in fields if f not in CATALOGUE_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                'success': False,
+                'error': 'Unknown fields',
+                'message': f"Fields not in the DocType catalogue: {', '.join(unknown)}. "
+                           f"Available: {', '.join(CATALOGUE_FIELDS)}",
+            },
+        )
+    return list(dict.fromkeys(["name", *fields]))
+
+
+doctype_catalogue = DoctypeCatalogue()
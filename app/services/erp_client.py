@@ -0,0 +1,185 @@
+"""
+Shared async HTTP client for all ERPNext calls.
+
+A single httpx.AsyncClient is kept for the lifetime of the app so every
+ERP request reuses pooled keep-alive connections instead of paying a new
+TCP/TLS handshake. Authentication is supplied per request, so the same
+pool serves both the service account and per-user token sessions.
+
+Identical GET requests (same path, params and auth identity) that are in
+flight at the same time are coalesced into one upstream call.
+"""
+import asyncio
+import inspect
+import os
+import time
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+import httpx
+from utils.settings import load_settings
+from utils.metrics import metrics
+
+load_settings()
+
+API_BASE = os.getenv("API_BASE")
+
+ERP_POOL_MAX_CONNECTIONS = int(os.getenv("ERP_POOL_MAX_CONNECTIONS", "100"))
+ERP_POOL_MAX_KEEPALIVE = int(os.getenv("ERP_POOL_MAX_KEEPALIVE", "20"))
+ERP_POOL_KEEPALIVE_EXPIRY = float(os.getenv("ERP_POOL_KEEPALIVE_EXPIRY", "30"))
+ERP_TIMEOUT = float(os.getenv("ERP_TIMEOUT", "10"))
+ERP_CONNECT_TIMEOUT = float(os.getenv("ERP_CONNECT_TIMEOUT", "5"))
+ERP_COALESCE_READS = os.getenv("ERP_COALESCE_READS", "true").lower() in ("1", "true", "yes")
+
+ERP_REQUEST_SECONDS = metrics.histogram(
+    "erp_request_duration_seconds", "ERP request latency by endpoint and status",
+    ("method", "endpoint", "status"),
+)
+ERP_REAUTH_RETRIES = metrics.counter(
+    "erp_reauth_retries_total", "ERP requests retried with fresh auth after a 403",
+    ("method", "endpoint"),
+)
+
+HeadersFn = Callable[[], Awaitable[Dict[str, str]]]
+# Called with the auth headers ERP rejected; may return an awaitable
+InvalidateFn = Callable[[Optional[Dict[str, str]]], Any]
+
+
+def endpoint_label(path: str, known_doctype: Optional[Callable[[str], bool]] = None) -> str:
+    """
+    Collapse an ERP path to a low-cardinality metrics label.
+    Document names are dropped and method names kept. Doctype names are
+    client-supplied, so only those known_doctype confirms are kept; the
+    rest become :doctype.
+    """
+    parts = path.split("?", 1)[0].strip("/").split("/")
+    if len(parts) >= 3 and parts[0] == "api" and parts[1] == "resource":
+        doctype = parts[2] if known_doctype is not None and known_doctype(parts[2]) else ":doctype"
+        return f"/api/resource/{doctype}" + ("/:name" if len(parts) > 3 else "")
+    return "/" + "/".join(parts)
+
+
+class ErpClient:
+    """
+    Thin wrapper around a pooled httpx.AsyncClient.
+    The underlying client is created lazily and closed via aclose().
+    """
+
+    def __init__(self, base_url: Optional[str] = API_BASE,
+                 max_connections: int = ERP_POOL_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = ERP_POOL_MAX_KEEPALIVE,
+                 keepalive_expiry: float = ERP_POOL_KEEPALIVE_EXPIRY,
+                 timeout: float = ERP_TIMEOUT,
+                 connect_timeout: float = ERP_CONNECT_TIMEOUT,
+                 coalesce_reads: bool = ERP_COALESCE_READS,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url or ""
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.coalesce_reads = coalesce_reads
+        # Which doctype names may appear in metrics labels (set by the app)
+        self.known_doctype: Optional[Callable[[str], bool]] = None
+        # Overridable (e.g. to point the benchmark at an in-process fake ERP)
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight_reads: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"reads": 0, "coalesced_reads": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self.limits,
+                timeout=self.timeout,
+                headers={"Accept": "application/json"},
+                transport=self.transport,
+                # Never persist response cookies: the pool is shared between
+                # the service account and per-user token sessions, so auth
+                # is always passed explicitly on each request.
+                cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+            )
+        return self._client
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        headers_fn: Optional[HeadersFn] = None,
+        invalidate_fn: Optional[InvalidateFn] = None,
+        params: Optional[Dict[str, Any]] = None,
+        json: Any = None,
+        timeout: Optional[float] = None,
+    ) -> httpx.Response:
+        """
+        Send a request to ERP.
+        headers_fn supplies auth headers; on a 403 the rejected headers are
+        passed to invalidate_fn and the request is retried once with fresh headers.
+        Concurrent identical GETs share one upstream call and its response.
+        """
+        if method.upper() != "GET" or not self.coalesce_reads:
+            return await self._send(method, path, headers_fn, invalidate_fn, params, json, timeout)
+
+        self.stats["reads"] += 1
+        headers = await headers_fn() if headers_fn else {}
+        key = (
+            path,
+            tuple(sorted((k, str(v)) for k, v in (params or {}).items())),
+            tuple(sorted(headers.items())),
+        )
+        task = self._inflight_reads.get(key)
+        if task is not None:
+            self.stats["coalesced_reads"] += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(
+            self._send(method, path, headers_fn, invalidate_fn, params, json, timeout)
+        )
+        self._inflight_reads[key] = task
+        task.add_done_callback(lambda t: self._on_read_done(key, t))
+        # Shielded so one caller being cancelled doesn't fail the others
+        return await asyncio.shield(task)
+
+    def _on_read_done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight_reads.get(key) is task:
+            del self._inflight_reads[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+    async def _send(self, method, path, headers_fn, invalidate_fn, params, json, timeout) -> httpx.Response:
+        endpoint = endpoint_label(path, self.known_doctype)
+        kwargs: Dict[str, Any] = {"params": params, "json": json}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        for attempt in range(2):
+            headers = await headers_fn() if headers_fn else None
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, path, headers=headers, **kwargs)
+            except httpx.HTTPError as e:
+                ERP_REQUEST_SECONDS.observe(time.perf_counter() - started, method, endpoint, type(e).__name__)
+                raise
+            ERP_REQUEST_SECONDS.observe(time.perf_counter() - started, method, endpoint, str(response.status_code))
+            if response.status_code == 403 and attempt == 0 and invalidate_fn:
+                print(f"[ERP] 403 on {method} {path}, re-authenticating...")
+                ERP_REAUTH_RETRIES.inc(method, endpoint)
+                result = invalidate_fn(headers)
+                if inspect.isawaitable(result):
+                    await result
+                continue
+            return response
+        return response  # unreachable but satisfies type checkers
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+erp_client = ErpClient()
@@ -1,26 +1,36 @@
-from .login import login_to_erp
-import os
+from .login import erp_service_request
+import base64
+import binascii
 import json
-import requests
+import os
+import httpx
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List
+from zoneinfo import ZoneInfo
 from fastapi import HTTPException
-from dotenv import load_dotenv
-load_dotenv()
+from utils.settings import load_settings
+
+load_settings()
 
-API_BASE = os.getenv("API_BASE")
+COUNT_ENDPOINT = "/api/method/frappe.client.get_count"
+DELETED_DOCUMENT_ENDPOINT = "/api/resource/Deleted Document"
 
-def get_doctype_count(
-    session: requests.Session,
+LINK_OPTIONS_PAGE_SIZE = int(os.getenv("LINK_OPTIONS_PAGE_SIZE", "500"))
+LINK_OPTIONS_MAX_PAGE_SIZE = int(os.getenv("LINK_OPTIONS_MAX_PAGE_SIZE", "5000"))
+# ERP's system time zone (e.g. "Asia/Kolkata"); needed to accept `since` values with an offset
+ERP_TIME_ZONE = os.getenv("ERP_TIME_ZONE", "")
+
+
+async def get_doctype_count(
     linked_doctype: str,
     filters: str | None = None,
 ) -> int:
     """Fetches the total count of documents matching the filters."""
-    COUNT_ENDPOINT = f"{API_BASE}/api/method/frappe.client.get_count"
-
     count_params: dict = {"doctype": linked_doctype}
     if filters:
         count_params["filters"] = filters
 
-    count_response = session.get(COUNT_ENDPOINT, params=count_params, timeout=10)
+    count_response = await erp_service_request("GET", COUNT_ENDPOINT, params=count_params)
     if count_response.status_code == 200:
         try:
             return int(count_response.json().get("message", 0))
@@ -32,65 +42,261 @@ def get_doctype_count(
         return 1000
 
 
-def fetch_link_options(
-    linked_doctype: str,
-    filter_field: str | None = None,
-    filter_value: str | None = None,
-):
-    session = login_to_erp()
-
-    filters: str | None = None
+def _build_filter_list(linked_doctype: str, filter_field: str | None, filter_value: str | None) -> List[list]:
     if filter_field and filter_value:
-        filters = json.dumps([[linked_doctype, filter_field, "=", filter_value]])
+        return [[linked_doctype, filter_field, "=", filter_value]]
+    return []
 
-    total_count = get_doctype_count(session, linked_doctype, filters=filters)
-    if total_count <= 0:
-        return []
 
-    fetch_params: dict = {"limit_start": 0, "limit_page_length": total_count}
-    if filters:
-        fetch_params["filters"] = filters
+def encode_cursor(last_name: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after": last_name}).encode("utf-8")).decode("ascii")
 
-    response = session.get(
-        f"{API_BASE}/api/resource/{linked_doctype}",
-        headers={"Content-Type": "application/json"},
-        timeout=10,
-        params=fetch_params,
-    )
-    if response.status_code == 403:
-        print("Session expired, logging in again...")
-        session = login_to_erp()
-        response = session.get(
-            f"{API_BASE}/api/resource/{linked_doctype}",
-            headers={"Content-Type": "application/json"},
-            timeout=10,
-            params=fetch_params,
-        )
 
+def decode_cursor(cursor: str) -> str:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["after"]
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+
+
+async def _fetch_page_after(
+    linked_doctype: str,
+    filter_list: List[list],
+    after: str | None,
+    page_size: int,
+    fields: List[str] | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Fetches one page ordered by name, starting after the given name.
+    Keyset pagination keeps each page cheap for ERP however deep the cursor is.
+    """
+    filters = list(filter_list)
+    if after is not None:
+        filters.append([linked_doctype, "name", ">", after])
+
+    params: dict = {
+        "limit_start": 0,
+        "limit_page_length": page_size,
+        "order_by": "name asc",
+    }
+    if filters:
+        params["filters"] = json.dumps(filters)
+    if fields:
+        params["fields"] = json.dumps(fields)
+
+    response = await erp_service_request("GET", f"/api/resource/{linked_doctype}", params=params)
     if response.status_code != 200:
         raise HTTPException(
             status_code=response.status_code,
             detail=f"Failed to fetch link options for '{linked_doctype}': {response.text}",
         )
+    return response.json().get("data") or []
+
 
-    data = response.json().get("data")
-    if not data:
-        raise HTTPException(status_code=404, detail=f"No data found for DocType: {linked_doctype}")
+async def fetch_link_options_page(
+    linked_doctype: str,
+    filter_field: str | None = None,
+    filter_value: str | None = None,
+    cursor: str | None = None,
+    page_size: int | None = None,
+    fields: List[str] | None = None,
+) -> Dict[str, Any]:
+    """Fetches a single cursor-paginated page of link options."""
+    page_size = min(page_size or LINK_OPTIONS_PAGE_SIZE, LINK_OPTIONS_MAX_PAGE_SIZE)
+    after = decode_cursor(cursor) if cursor else None
 
-    return data
+    data = await _fetch_page_after(
+        linked_doctype,
+        _build_filter_list(linked_doctype, filter_field, filter_value),
+        after,
+        page_size,
+        fields=fields,
+    )
+    next_cursor = encode_cursor(data[-1]["name"]) if len(data) == page_size else None
+    return {"data": data, "next_cursor": next_cursor}
 
 
-def fetch_link_options_count(
+def stream_link_options(
     linked_doctype: str,
     filter_field: str | None = None,
     filter_value: str | None = None,
-):
-    """Fetches the total count of records for a linked_doctype without fetching all data."""
-    session = login_to_erp()
+    page_size: int | None = None,
+    fields: List[str] | None = None,
+    cursor: str | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Yields link options as NDJSON, one record per line.
+    ERP pages are fetched in order and forwarded as they arrive, so memory
+    use stays flat regardless of the size of the linked doctype.
+    With a cursor the stream resumes after that record. If a page fails
+    mid-stream, a final error line carries the cursor to resume from.
+    """
+    page_size = min(page_size or LINK_OPTIONS_PAGE_SIZE, LINK_OPTIONS_MAX_PAGE_SIZE)
+    filter_list = _build_filter_list(linked_doctype, filter_field, filter_value)
+    # Decoded here, before the response starts, so a bad cursor is still a 400
+    after = decode_cursor(cursor) if cursor else None
+    return _stream_pages(linked_doctype, filter_list, after, page_size, fields)
 
-    filters: str | None = None
-    if filter_field and filter_value:
-        filters = json.dumps([[linked_doctype, filter_field, "=", filter_value]])
 
-    total_count = get_doctype_count(session, linked_doctype, filters=filters)
-    return {"total_count": total_count}
\ No newline at end of file
+async def _stream_pages(
+    linked_doctype: str,
+    filter_list: List[list],
+    after: str | None,
+    page_size: int,
+    fields: List[str] | None,
+) -> AsyncIterator[bytes]:
+    while True:
+        try:
+            data = await _fetch_page_after(linked_doctype, filter_list, after, page_size, fields=fields)
+        except (HTTPException, httpx.HTTPError) as e:
+            # Headers are already sent, so report the failure in-band
+            if isinstance(e, HTTPException):
+                error = {"error": e.detail, "status_code": e.status_code}
+            else:
+                error = {"error": f"ERP request failed: {type(e).__name__}: {e}", "status_code": 502}
+            error["next_cursor"] = encode_cursor(after) if after is not None else None
+            yield (json.dumps(error) + "\n").encode("utf-8")
+            return
+
+        if data:
+            yield "".join(json.dumps(row) + "\n" for row in data).encode("utf-8")
+        if len(data) < page_size:
+            return
+        after = data[-1]["name"]
+
+
+async def fetch_all_link_rows(
+    linked_doctype: str,
+    fields: List[str] | None = None,
+    page_size: int | None = None,
+) -> List[Dict[str, Any]]:
+    """Fetches every record of a linked doctype page by page (no count request, no single huge response)."""
+    page_size = min(page_size or LINK_OPTIONS_PAGE_SIZE, LINK_OPTIONS_MAX_PAGE_SIZE)
+    rows: List[Dict[str, Any]] = []
+    after = None
+    while True:
+        data = await _fetch_page_after(linked_doctype, [], after, page_size, fields=fields)
+        rows.extend(data)
+        if len(data) < page_size:
+            return rows
+        after = data[-1]["name"]
+
+
+def normalize_since(since: str) -> str:
+    """
+    Validates a `since` timestamp and converts it to Frappe's datetime format.
+    ERP stores naive timestamps in its system time zone, so a timestamp with
+    an offset is converted to ERP_TIME_ZONE, or rejected when that isn't set.
+    """
+    try:
+        parsed = datetime.fromisoformat(since.strip())
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid since timestamp: {since}")
+    if parsed.tzinfo is not None:
+        if not ERP_TIME_ZONE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"since must be ERP local time without a UTC offset: {since}",
+            )
+        parsed = parsed.astimezone(ZoneInfo(ERP_TIME_ZONE)).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+async def _fetch_all_after(
+    endpoint: str,
+    doctype: str,
+    filters: List[list],
+    fields: List[str],
+    sort_field: str,
+    page_size: int,
+) -> List[Dict[str, Any]]:
+    """
+    Fetches every matching row ordered by (sort_field, name), page by page.
+    Each page starts after the last (sort_field, name) seen rather than at an
+    offset, so a row whose sort_field changes mid-scan can't shift an unseen
+    row into an already fetched page (it is fetched again later instead).
+    """
+    fields = list(dict.fromkeys(["name", sort_field, *fields]))
+    rows: List[Dict[str, Any]] = []
+    last = None
+    while True:
+        page_filters = list(filters)
+        params: dict = {
+            "fields": json.dumps(fields),
+            "order_by": f"{sort_field} asc, name asc",
+            "limit_start": 0,
+            "limit_page_length": page_size,
+        }
+        if last is not None:
+            # sort_field >= last AND (sort_field > last OR name > last name)
+            last_value, last_name = last
+            page_filters.append([doctype, sort_field, ">=", last_value])
+            params["or_filters"] = json.dumps([
+                [doctype, sort_field, ">", last_value],
+                [doctype, "name", ">", last_name],
+            ])
+        params["filters"] = json.dumps(page_filters)
+
+        response = await erp_service_request("GET", endpoint, params=params)
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Failed to fetch {endpoint}: {response.text}",
+            )
+        data = response.json().get("data") or []
+        rows.extend(data)
+        if len(data) < page_size:
+            return rows
+        last = (str(data[-1][sort_field]), data[-1]["name"])
+
+
+async def fetch_link_options_delta(
+    linked_doctype: str,
+    since: str,
+    filter_field: str | None = None,
+    filter_value: str | None = None,
+    fields: List[str] | None = None,
+) -> Dict[str, Any]:
+    """
+    Returns records created or modified at or after `since`, the names
+    deleted since then and a new watermark for the next call.
+    The watermark comes from ERP's own timestamps so client clocks don't matter;
+    records on the boundary may be sent twice and should be upserted.
+    Deleted names are not filtered by filter_field (the records are gone),
+    so clients should simply drop any of them they hold.
+    """
+    since = normalize_since(since)
+    page_size = LINK_OPTIONS_PAGE_SIZE
+
+    filters = _build_filter_list(linked_doctype, filter_field, filter_value)
+    filters.append([linked_doctype, "modified", ">=", since])
+    changed = await _fetch_all_after(
+        f"/api/resource/{linked_doctype}",
+        linked_doctype,
+        filters,
+        fields or [],
+        "modified",
+        page_size,
+    )
+
+    deleted_rows = await _fetch_all_after(
+        DELETED_DOCUMENT_ENDPOINT,
+        "Deleted Document",
+        [
+            ["Deleted Document", "deleted_doctype", "=", linked_doctype],
+            ["Deleted Document", "creation", ">=", since],
+        ],
+        ["deleted_name"],
+        "creation",
+        page_size,
+    )
+
+    timestamps = [since]
+    timestamps += [str(row["modified"]) for row in changed if row.get("modified")]
+    timestamps += [str(row["creation"]) for row in deleted_rows if row.get("creation")]
+
+    return {
+        "data": changed,
+        "deleted": [row["deleted_name"] for row in deleted_rows],
+        "watermark": max(timestamps, key=lambda ts: datetime.fromisoformat(ts)),
+    }
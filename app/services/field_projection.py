@@ -0,0 +1,55 @@
+from fastapi import HTTPException
+from typing import List
+from .create_schema_hash import LAYOUT_FIELD_TYPES
+from .doctype_cache import get_cached_doctype
+
+# Columns every Frappe document has, regardless of its DocType fields
+STANDARD_FIELDS = {
+    "name",
+    "owner",
+    "creation",
+    "modified",
+    "modified_by",
+    "docstatus",
+    "idx",
+}
+
+# Child tables can't be selected as plain columns
+TABLE_FIELD_TYPES = {"Table", "Table MultiSelect"}
+
+
+def parse_fields(fields: str | None) -> List[str] | None:
+    """Parses a comma-separated `fields` query parameter."""
+    if not fields:
+        return None
+    parsed = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    return parsed or None
+
+
+async def validate_fields(doctype: str, fields: List[str] | None) -> List[str] | None:
+    """
+    Checks requested fields against the cached DocType schema.
+    `name` is always included so results stay addressable (and pageable).
+    """
+    if not fields:
+        return None
+
+    schema = await get_cached_doctype(doctype)
+    allowed = STANDARD_FIELDS | {
+        f.get("fieldname")
+        for f in schema.get("fields", [])
+        if f.get("fieldtype") not in LAYOUT_FIELD_TYPES | TABLE_FIELD_TYPES
+    }
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                'success': False,
+                'error': 'Unknown fields',
+                'message': f"Fields not found on DocType '{doctype}': {', '.join(unknown)}",
+                'unknown_fields': unknown,
+            }
+        )
+
+    return fields if "name" in fields else ["name", *fields]
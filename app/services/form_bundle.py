@@ -0,0 +1,80 @@
+import asyncio
+from fastapi import HTTPException
+from typing import Any, Dict, List
+from .doctype_cache import get_cached_doctype
+from .create_schema_hash import get_schema_hash
+from .link_options_cache import link_options_cache
+from .submission_validation import TABLE_FIELD_TYPES
+
+
+def get_link_targets(doctype_schema: Dict[str, Any]) -> List[str]:
+    """Returns the distinct doctypes referenced by the schema's Link fields, in field order."""
+    return list(dict.fromkeys(
+        f["options"]
+        for f in doctype_schema.get("fields", [])
+        if f.get("fieldtype") == "Link" and f.get("options")
+    ))
+
+
+def get_child_doctypes(doctype_schema: Dict[str, Any]) -> List[str]:
+    """Returns the distinct child DocTypes of the schema's Table fields, in field order."""
+    return list(dict.fromkeys(
+        f["options"]
+        for f in doctype_schema.get("fields", [])
+        if f.get("fieldtype") in TABLE_FIELD_TYPES and f.get("options")
+    ))
+
+
+def _error_detail(error: Exception) -> Dict[str, Any]:
+    if isinstance(error, HTTPException):
+        return {"status_code": error.status_code, "detail": error.detail}
+    return {"status_code": 500, "detail": str(error)}
+
+
+async def build_form_bundle(form_name: str) -> Dict[str, Any]:
+    """
+    Returns everything needed to open a form in one round trip: the DocType,
+    its schema hash, the schemas of its child tables and the options of every
+    Link field on the form or in its child tables, fetched concurrently.
+    A child table or Link field that fails to load is reported in `errors`
+    (by DocType) instead of failing the whole bundle.
+    """
+    doctype_data = await get_cached_doctype(form_name)
+    child_names = get_child_doctypes(doctype_data)
+    child_results = await asyncio.gather(
+        *(get_cached_doctype(name) for name in child_names),
+        return_exceptions=True,
+    )
+
+    child_doctypes: Dict[str, Any] = {}
+    errors: Dict[str, Any] = {}
+    for name, result in zip(child_names, child_results):
+        if isinstance(result, Exception):
+            errors[name] = _error_detail(result)
+        else:
+            child_doctypes[name] = result
+
+    link_targets = list(dict.fromkeys([
+        *get_link_targets(doctype_data),
+        *(target for child in child_doctypes.values() for target in get_link_targets(child)),
+    ]))
+
+    results = await asyncio.gather(
+        *(link_options_cache.get_options(target) for target in link_targets),
+        return_exceptions=True,
+    )
+
+    link_options: Dict[str, Any] = {}
+    for target, result in zip(link_targets, results):
+        if isinstance(result, Exception):
+            errors[target] = _error_detail(result)
+        else:
+            link_options[target] = result
+
+    return {
+        "data": doctype_data,
+        "schema_hash": get_schema_hash(doctype_data),
+        "child_doctypes": child_doctypes,
+        "link_options": link_options,
+        "errors": errors,
+    }
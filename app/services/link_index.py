@@ -0,0 +1,276 @@
+"""
+In-memory membership index for Link field values.
+
+For each linked DocType the set of existing record names is loaded once
+(shared between workers like link options) and then kept current from the
+`modified` watermark: records changed since the last refresh are added
+and deleted ones removed. Masters above LINK_INDEX_BLOOM_THRESHOLD rows
+are held in a Bloom filter instead of a set, trading exact answers for a
+few bytes per name.
+
+Names are compared case-insensitively, as ERP's own Link lookup is.
+A name reported missing may simply be newer than the last refresh, so a
+miss triggers a (rate-limited) incremental refresh before it is trusted.
+Indexes of the warm-up forms' Link targets are built at startup; a
+DocType whose index can't be built (e.g. one the service account may not
+list) is not retried until LINK_INDEX_FAILURE_TTL has passed.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from utils.settings import load_settings
+from .fetch_link_options import fetch_all_link_rows, fetch_link_options_delta
+from .shared_state import shared_state
+
+load_settings()
+
+LINK_INDEX_ENABLED = os.getenv("LINK_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+LINK_INDEX_MAX_DOCTYPES = int(os.getenv("LINK_INDEX_MAX_DOCTYPES", "64"))
+# Seconds between background incremental refreshes of an index
+LINK_INDEX_REFRESH_INTERVAL = float(os.getenv("LINK_INDEX_REFRESH_INTERVAL", "60"))
+# A lookup miss refreshes the index first, at most this often
+LINK_INDEX_MISS_REFRESH_INTERVAL = float(os.getenv("LINK_INDEX_MISS_REFRESH_INTERVAL", "5"))
+# Full reloads drop names renamed away since the last one
+LINK_INDEX_REBUILD_INTERVAL = float(os.getenv("LINK_INDEX_REBUILD_INTERVAL", "3600"))
+LINK_INDEX_BLOOM_THRESHOLD = int(os.getenv("LINK_INDEX_BLOOM_THRESHOLD", "200000"))
+LINK_INDEX_BLOOM_FP_RATE = float(os.getenv("LINK_INDEX_BLOOM_FP_RATE", "0.001"))
+# Seconds a failed index build is remembered before it is attempted again
+LINK_INDEX_FAILURE_TTL = float(os.getenv("LINK_INDEX_FAILURE_TTL", "60"))
+
+SHARED_NAMESPACE = "link_index"
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings (double hashing on one blake2b digest).
+    """
+
+    def __init__(self, capacity: int, fp_rate: float = LINK_INDEX_BLOOM_FP_RATE):
+        self.capacity = max(1, capacity)
+        self.bits = max(8, int(-self.capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.bits / self.capacity * math.log(2)))
+        self._array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, value: str):
+        for pos in self._positions(value):
+            self._array[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self._array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._array)
+
+
+def _build_members(names: List[str], bloom_threshold: int):
+    names = [name.casefold() for name in names]
+    if len(names) <= bloom_threshold:
+        return set(names)
+    # Headroom so records created before the next rebuild still fit
+    bloom = BloomFilter(capacity=len(names) * 2)
+    for name in names:
+        bloom.add(name)
+    return bloom
+
+
+class LinkIndex:
+    """
+    Names of one linked DocType, with the watermark of the last refresh.
+    """
+
+    def __init__(self, doctype: str, members, watermark: Optional[str]):
+        self.doctype = doctype
+        self.members = members
+        self.watermark = watermark
+        self.built_at = time.monotonic()
+        self.refreshed_at = self.built_at
+        # Set when a Bloom filter can no longer be updated in place
+        self.needs_rebuild = False
+
+    @property
+    def exact(self) -> bool:
+        return isinstance(self.members, set)
+
+    @property
+    def size(self) -> int:
+        return len(self.members) if self.exact else self.members.count
+
+    def __contains__(self, name: str) -> bool:
+        return name.casefold() in self.members
+
+    def apply_delta(self, delta: Dict[str, Any]):
+        names = [row["name"].casefold() for row in delta["data"]]
+        if self.exact:
+            self.members.update(names)
+            self.members.difference_update(name.casefold() for name in delta["deleted"])
+        else:
+            for name in names:
+                self.members.add(name)
+            # Bloom filters can't forget a name, and overfull ones lose precision
+            if delta["deleted"] or self.members.count > self.members.capacity:
+                self.needs_rebuild = True
+        self.watermark = delta["watermark"]
+        self.refreshed_at = time.monotonic()
+
+
+def _max_modified(rows: List[Dict[str, Any]]) -> Optional[str]:
+    stamps = [str(row["modified"]) for row in rows if row.get("modified")]
+    return max(stamps) if stamps else None
+
+
+class LinkIndexRegistry:
+    """
+    LRU of per-DocType membership indexes.
+    """
+
+    def __init__(self, max_doctypes: int = LINK_INDEX_MAX_DOCTYPES,
+                 refresh_interval: float = LINK_INDEX_REFRESH_INTERVAL,
+                 miss_refresh_interval: float = LINK_INDEX_MISS_REFRESH_INTERVAL,
+                 rebuild_interval: float = LINK_INDEX_REBUILD_INTERVAL,
+                 bloom_threshold: int = LINK_INDEX_BLOOM_THRESHOLD,
+                 failure_ttl: float = LINK_INDEX_FAILURE_TTL):
+        self.max_doctypes = max_doctypes
+        self.refresh_interval = refresh_interval
+        self.miss_refresh_interval = miss_refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.bloom_threshold = bloom_threshold
+        self.failure_ttl = failure_ttl
+        self._indexes: "OrderedDict[str, LinkIndex]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+        # doctype -> (failed_at, error) of builds that failed with no index to fall back on
+        self._failures: Dict[str, Tuple[float, Exception]] = {}
+        self.stats = {
+            "builds": 0,
+            "refreshes": 0,
+            "miss_refreshes": 0,
+            "lookups": 0,
+            "missing": 0,
+            "evictions": 0,
+            "failed_builds": 0,
+            "negative_hits": 0,
+        }
+
+    async def _build(self, doctype: str) -> LinkIndex:
+        rows = await shared_state.get_or_refresh(
+            SHARED_NAMESPACE, doctype,
+            lambda _previous: fetch_all_link_rows(doctype, fields=["name", "modified"]),
+            ttl=self.refresh_interval,
+        )
+        names = [row["name"] for row in rows]
+        # Hashing a large master into a Bloom filter would stall the event loop
+        members = await asyncio.get_running_loop().run_in_executor(
+            None, _build_members, names, self.bloom_threshold
+        )
+        self.stats["builds"] += 1
+        return LinkIndex(doctype, members, _max_modified(rows))
+
+    async def _load(self, doctype: str) -> LinkIndex:
+        index = self._indexes.get(doctype)
+        if (index is None or index.watermark is None or index.needs_rebuild
+                or time.monotonic() - index.built_at > self.rebuild_interval):
+            index = await self._build(doctype)
+        else:
+            index.apply_delta(await fetch_link_options_delta(doctype, index.watermark))
+            self.stats["refreshes"] += 1
+        self._put(doctype, index)
+        return index
+
+    def _put(self, doctype: str, index: LinkIndex):
+        self._indexes[doctype] = index
+        self._indexes.move_to_end(doctype)
+        while len(self._indexes) > self.max_doctypes:
+            self._indexes.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _start_load(self, doctype: str) -> asyncio.Task:
+        task = self._loading.get(doctype)
+        if task is None:
+            task = asyncio.ensure_future(self._load(doctype))
+            self._loading[doctype] = task
+            task.add_done_callback(lambda t: self._on_load_done(doctype, t))
+        return task
+
+    def _on_load_done(self, doctype: str, task: asyncio.Task):
+        self._loading.pop(doctype, None)
+        if task.cancelled():
+            return
+        if task.exception() is None:
+            self._failures.pop(doctype, None)
+            return
+        print(f"[LinkIndex] Failed to load {doctype}: {task.exception()}")
+        if doctype not in self._indexes:
+            self._failures[doctype] = (time.monotonic(), task.exception())
+            self.stats["failed_builds"] += 1
+
+    async def _get_index(self, doctype: str) -> LinkIndex:
+        index = self._indexes.get(doctype)
+        if index is None:
+            failure = self._failures.get(doctype)
+            if failure is not None and time.monotonic() - failure[0] < self.failure_ttl:
+                self.stats["negative_hits"] += 1
+                raise failure[1].with_traceback(None)
+            return await asyncio.shield(self._start_load(doctype))
+        self._indexes.move_to_end(doctype)
+        if time.monotonic() - index.refreshed_at > self.refresh_interval:
+            self._start_load(doctype)
+        return index
+
+    async def warm(self, doctype: str):
+        """Build the index for doctype ahead of its first lookup."""
+        await self._get_index(doctype)
+
+    async def find_missing(self, doctype: str, values: Iterable[str]) -> Set[str]:
+        """Return the values that are not names of existing doctype records."""
+        values = set(values)
+        index = await self._get_index(doctype)
+        missing = {v for v in values if v not in index}
+        self.stats["lookups"] += len(values)
+        if missing and time.monotonic() - index.refreshed_at > self.miss_refresh_interval:
+            # The records may have been created since the last refresh
+            self.stats["miss_refreshes"] += 1
+            index = await asyncio.shield(self._start_load(doctype))
+            missing = {v for v in missing if v not in index}
+        self.stats["missing"] += len(missing)
+        return missing
+
+    async def check(self, doctype: str, values: List[str]) -> Dict[str, Any]:
+        """Bulk membership lookup; exact is False when a Bloom filter answered."""
+        missing = await self.find_missing(doctype, values)
+        index = self._indexes.get(doctype)
+        return {
+            "doctype": doctype,
+            "valid": [v for v in dict.fromkeys(values) if v not in missing],
+            "missing": [v for v in dict.fromkeys(values) if v in missing],
+            "exact": index.exact if index is not None else True,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "failed_doctypes": list(self._failures),
+            "doctypes": {
+                doctype: {
+                    "names": index.size,
+                    "kind": "set" if index.exact else "bloom",
+                    "bloom_bytes": None if index.exact else index.members.size_bytes,
+                    "watermark": index.watermark,
+                }
+                for doctype, index in self._indexes.items()
+            },
+        }
+
+
+link_index = LinkIndexRegistry()
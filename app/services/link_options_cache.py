@@ -0,0 +1,184 @@
+"""
+Server-side cache for link options.
+
+For each (linked doctype, filter field) pair the whole dataset is loaded
+once and grouped by the filter field in memory, so every filter_value of
+a cascading dropdown (and its count) is answered without going to ERP.
+Filter values match case-insensitively, as ERP's own `=` filter does.
+Entries are bounded by total row count, expire after a TTL and are then
+refreshed in the background while the stale copy keeps being served.
+Loaded datasets are published to the shared state store so other workers
+reuse them, and only one worker reloads a given dataset at a time.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from utils.settings import load_settings
+from .fetch_link_options import fetch_all_link_rows
+from .shared_state import shared_state
+
+load_settings()
+
+LINK_OPTIONS_CACHE_MAX_ROWS = int(os.getenv("LINK_OPTIONS_CACHE_MAX_ROWS", "200000"))
+LINK_OPTIONS_CACHE_TTL = float(os.getenv("LINK_OPTIONS_CACHE_TTL", "300"))
+# Stale entries older than this are reloaded inline instead of served
+LINK_OPTIONS_CACHE_MAX_STALE = float(os.getenv("LINK_OPTIONS_CACHE_MAX_STALE", "3600"))
+
+# (linked doctype, filter field, sorted projected fields)
+CacheKey = Tuple[str, Optional[str], Tuple[str, ...]]
+
+DEFAULT_FIELDS = ("name",)
+
+SHARED_NAMESPACE = "link_options"
+
+
+class LinkOptionsEntry:
+    """
+    One loaded dataset, grouped by the filter field (if any).
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]], filter_field: Optional[str],
+                 fields: Tuple[str, ...] = DEFAULT_FIELDS):
+        self.loaded_at = time.monotonic()
+        self.row_count = len(rows)
+        self.fields = fields
+        self.options = [{field: row.get(field) for field in fields} for row in rows]
+        self.groups: Dict[str, List[Dict[str, Any]]] = {}
+        if filter_field:
+            for row, option in zip(rows, self.options):
+                value = row.get(filter_field)
+                if value is None:
+                    continue
+                self.groups.setdefault(str(value).casefold(), []).append(option)
+
+    def lookup(self, filter_value: Optional[str]) -> List[Dict[str, Any]]:
+        if filter_value is None:
+            return self.options
+        return self.groups.get(filter_value.casefold(), [])
+
+
+class LinkOptionsCache:
+    """
+    Row-bounded LRU cache of link option datasets.
+    """
+
+    def __init__(self, max_rows: int = LINK_OPTIONS_CACHE_MAX_ROWS, ttl: float = LINK_OPTIONS_CACHE_TTL,
+                 max_stale: float = LINK_OPTIONS_CACHE_MAX_STALE):
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries: "OrderedDict[CacheKey, LinkOptionsEntry]" = OrderedDict()
+        self._loading: Dict[CacheKey, asyncio.Task] = {}
+        self._total_rows = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale_hits": 0,
+            "background_refreshes": 0,
+            "evictions": 0,
+            "uncacheable": 0,
+        }
+
+    async def _load(self, key: CacheKey) -> LinkOptionsEntry:
+        linked_doctype, filter_field, fields = key
+        load_fields = list(dict.fromkeys([*fields, filter_field] if filter_field else fields))
+        rows = await shared_state.get_or_refresh(
+            SHARED_NAMESPACE, json.dumps(key),
+            lambda _previous: fetch_all_link_rows(linked_doctype, fields=load_fields),
+            ttl=self.ttl,
+        )
+        entry = LinkOptionsEntry(rows, filter_field, fields)
+        self._put(key, entry)
+        return entry
+
+    def _put(self, key: CacheKey, entry: LinkOptionsEntry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._total_rows -= old.row_count
+        if entry.row_count > self.max_rows:
+            # Too big to keep; callers still get this load's result
+            self.stats["uncacheable"] += 1
+            return
+        self._entries[key] = entry
+        self._total_rows += entry.row_count
+        while self._total_rows > self.max_rows:
+            _, evicted = self._entries.popitem(last=False)
+            self._total_rows -= evicted.row_count
+            self.stats["evictions"] += 1
+
+    def _start_load(self, key: CacheKey) -> asyncio.Task:
+        """Start loading a dataset, sharing the load with concurrent callers."""
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key))
+            self._loading[key] = task
+            task.add_done_callback(lambda t: self._on_load_done(key, t))
+        return task
+
+    def _on_load_done(self, key: CacheKey, task: asyncio.Task):
+        self._loading.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[LinkOptionsCache] Failed to load {key}: {task.exception()}")
+
+    async def _get_entry(self, linked_doctype: str, filter_field: Optional[str],
+                         fields: Optional[List[str]] = None) -> LinkOptionsEntry:
+        # One dataset per set of columns, whatever order they were asked for in
+        key = (linked_doctype, filter_field or None, tuple(sorted(set(fields))) if fields else DEFAULT_FIELDS)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return await asyncio.shield(self._start_load(key))
+
+        self._entries.move_to_end(key)
+        age = time.monotonic() - entry.loaded_at
+        if age < self.ttl:
+            self.stats["hits"] += 1
+            return entry
+        if age > self.max_stale:
+            self.stats["misses"] += 1
+            return await asyncio.shield(self._start_load(key))
+
+        # Serve the stale copy and refresh in the background
+        self.stats["stale_hits"] += 1
+        if key not in self._loading:
+            self.stats["background_refreshes"] += 1
+            self._start_load(key)
+        return entry
+
+    async def get_options(self, linked_doctype: str, filter_field: str | None = None,
+                          filter_value: str | None = None,
+                          fields: List[str] | None = None) -> List[Dict[str, Any]]:
+        if not (filter_field and filter_value):
+            filter_field = filter_value = None
+        entry = await self._get_entry(linked_doctype, filter_field, fields)
+        options = entry.lookup(filter_value)
+        if fields and list(fields) != list(entry.fields):
+            # Columns in the order this request asked for them
+            columns = list(dict.fromkeys(fields))
+            options = [{field: option.get(field) for field in columns} for option in options]
+        return options
+
+    async def get_count(self, linked_doctype: str, filter_field: str | None = None,
+                        filter_value: str | None = None) -> int:
+        return len(await self.get_options(linked_doctype, filter_field, filter_value))
+
+    def invalidate(self, linked_doctype: str | None = None):
+        for key in list(self._entries):
+            if linked_doctype is None or key[0] == linked_doctype:
+                self._total_rows -= self._entries.pop(key).row_count
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "rows": self._total_rows,
+            "max_rows": self.max_rows,
+            "hit_rate": ((self.stats["hits"] + self.stats["stale_hits"]) / lookups) if lookups else 0.0,
+        }
+
+
+link_options_cache = LinkOptionsCache()
@@ -0,0 +1,84 @@
+"""
+Shared access to the service's local SQLite database.
+
+A single WAL-mode connection is owned by one worker thread; every query
+runs on that thread, so callers on the event loop never block on disk
+I/O and never pay for opening a new connection.
+"""
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, TypeVar
+from utils.settings import load_settings
+
+load_settings()
+
+T = TypeVar("T")
+
+DB_PATH = os.getenv(
+    "LOCAL_DB_PATH", os.path.join(os.path.dirname(__file__), "..", "..", "user_erp_keys.db")
+)
+
+
+class LocalDatabase:
+    """
+    Single-connection SQLite wrapper. fn(conn, *args) runs inside a transaction
+    that is committed on success and rolled back on error.
+    Schema setup registered with register_schema() runs when the connection
+    is first opened (normally from init() in the app lifespan), not at import.
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-db")
+        self._schemas: List[Callable[[sqlite3.Connection], Any]] = []
+
+    def register_schema(self, fn: Callable[[sqlite3.Connection], Any]):
+        """Register an idempotent fn(conn) that creates tables and indexes."""
+        self._schemas.append(fn)
+        if self._conn is not None:
+            self.run_sync(fn)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            for fn in self._schemas:
+                with conn:
+                    fn(conn)
+            self._conn = conn
+        return self._conn
+
+    def _call(self, fn: Callable[..., T], args: tuple) -> T:
+        conn = self._connection()
+        with conn:
+            return fn(conn, *args)
+
+    def run_sync(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run on the database thread and wait (for use outside the event loop)."""
+        return self._executor.submit(self._call, fn, args).result()
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, fn, args)
+
+    async def init(self):
+        """Open the connection and create registered tables."""
+        await self.run(lambda conn: None)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close)
+
+
+local_db = LocalDatabase()
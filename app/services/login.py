@@ -1,115 +1,370 @@
-import requests
+import asyncio
 import os
-import sqlite3
-from typing import Dict
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
 from fastapi import HTTPException
-from dotenv import load_dotenv
+from utils.settings import load_settings
+from .erp_client import erp_client
+from .local_db import local_db
+from .shared_state import shared_state
+from utils.metrics import metrics
 
-load_dotenv()
+load_settings()
 
-API_BASE = os.getenv("API_BASE")
 ERP_USER = os.getenv("ERP_USER")
 ERP_PASS = os.getenv("ERP_PASS")
 
-_DB_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "user_erp_keys.db")
-
-SESSION_COOKIES = None
-_user_sessions: Dict[str, requests.Session] = {}
+USER_SESSION_CACHE_MAX_ENTRIES = int(os.getenv("USER_SESSION_CACHE_MAX_ENTRIES", "1000"))
+USER_SESSION_IDLE_TTL = float(os.getenv("USER_SESSION_IDLE_TTL", "3600"))
+# The service session is replaced in the background once it is this old
+# (keep it below the ERP's session expiry)
+ERP_SESSION_MAX_AGE = float(os.getenv("ERP_SESSION_MAX_AGE", "18000"))
+# How often the background keeper checks (and so keeps alive) the service session
+ERP_SESSION_KEEPALIVE_INTERVAL = float(os.getenv("ERP_SESSION_KEEPALIVE_INTERVAL", "300"))
+
+SESSION_CHECK_ENDPOINT = "/api/method/frappe.auth.get_logged_user"
+SHARED_SESSION_NAMESPACE = "erp_session"
+SHARED_SESSION_KEY = "service"
+
+SESSION_COOKIES: Dict[str, str] | None = None
+# {"cookies": ..., "created_at": ...} as published in the shared state store
+_service_session: Dict[str, Any] | None = None
+# Serializes service-account logins within this worker
+_login_lock = asyncio.Lock()
+
+ERP_LOGINS = metrics.counter("erp_logins_total", "Service-account logins to ERP", ("result",))
+ERP_SESSION_REFRESHES = metrics.counter(
+    "erp_session_refreshes_total", "Service-account session replacements", ("reason",)
+)
+ERP_USER_PROVISIONS = metrics.counter(
+    "erp_user_credentials_provisioned_total", "Per-user ERP API keys generated", ("result",)
+)
+
+
+class UserSessionCache:
+    """
+    LRU cache of per-user ERP auth headers with an idle TTL.
+    Requests for all users share erp_client's connection pool, so an evicted
+    entry holds no connections; it is simply reloaded from the credential store.
+    """
 
-_ERP_JSON_HEADER = {"Content-Type": "application/json"}
+    def __init__(self, max_entries: int = USER_SESSION_CACHE_MAX_ENTRIES, idle_ttl: float = USER_SESSION_IDLE_TTL):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        # email -> (auth headers, last used)
+        self._entries: "OrderedDict[str, tuple[Dict[str, str], float]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, email: str) -> Optional[Dict[str, str]]:
+        entry = self._entries.get(email)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        headers, last_used = entry
+        now = time.monotonic()
+        if now - last_used > self.idle_ttl:
+            del self._entries[email]
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self._entries[email] = (headers, now)
+        self._entries.move_to_end(email)
+        return headers
+
+    def put(self, email: str, headers: Dict[str, str]):
+        self._entries[email] = (headers, time.monotonic())
+        self._entries.move_to_end(email)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def peek(self, email: str) -> Optional[Dict[str, str]]:
+        """Current headers without touching recency or stats."""
+        entry = self._entries.get(email)
+        return entry[0] if entry else None
+
+    def pop(self, email: str) -> Optional[Dict[str, str]]:
+        entry = self._entries.pop(email, None)
+        return entry[0] if entry else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def snapshot(self) -> Dict[str, float]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hit_rate": (self.stats["hits"] / lookups) if lookups else 0.0,
+        }
+
+
+_user_sessions = UserSessionCache()
+# email -> in-flight provisioning, so concurrent first requests generate keys once
+_provisioning: Dict[str, asyncio.Task] = {}
+
+
+def user_session_cache_snapshot() -> Dict[str, float]:
+    return _user_sessions.snapshot()
+
+
+def _init_db(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_erp_credentials (
+            email TEXT PRIMARY KEY,
+            api_key TEXT NOT NULL,
+            api_secret TEXT NOT NULL
+        )
+    """)
 
+local_db.register_schema(_init_db)
 
-def _init_db():
-    with sqlite3.connect(_DB_PATH) as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS user_erp_credentials (
-                email TEXT PRIMARY KEY,
-                api_key TEXT NOT NULL,
-                api_secret TEXT NOT NULL
-            )
-        """)
 
-_init_db()
+def _select_credentials(conn, email: str):
+    return conn.execute(
+        "SELECT api_key, api_secret FROM user_erp_credentials WHERE email = ?", (email,)
+    ).fetchone()
 
 
-def _load_stored_credentials(email: str):
-    with sqlite3.connect(_DB_PATH) as conn:
-        row = conn.execute(
-            "SELECT api_key, api_secret FROM user_erp_credentials WHERE email = ?", (email,)
-        ).fetchone()
+async def _load_stored_credentials(email: str):
+    row = await local_db.run(_select_credentials, email)
     return (row[0], row[1]) if row else None
 
 
-def _store_credentials(email: str, api_key: str, api_secret: str):
-    with sqlite3.connect(_DB_PATH) as conn:
-        conn.execute(
-            "INSERT OR REPLACE INTO user_erp_credentials (email, api_key, api_secret) VALUES (?, ?, ?)",
-            (email, api_key, api_secret),
-        )
+def _upsert_credentials(conn, email: str, api_key: str, api_secret: str):
+    conn.execute(
+        "INSERT OR REPLACE INTO user_erp_credentials (email, api_key, api_secret) VALUES (?, ?, ?)",
+        (email, api_key, api_secret),
+    )
+
+
+async def _store_credentials(email: str, api_key: str, api_secret: str):
+    await local_db.run(_upsert_credentials, email, api_key, api_secret)
+
+
+def _delete_credentials(conn, email: str, stale_headers: Optional[Dict[str, str]] = None):
+    if stale_headers is None:
+        conn.execute("DELETE FROM user_erp_credentials WHERE email = ?", (email,))
+        return
+    # Keep credentials another worker has already re-provisioned
+    row = _select_credentials(conn, email)
+    if row and _build_token_headers(row[0], row[1]) == stale_headers:
+        conn.execute("DELETE FROM user_erp_credentials WHERE email = ?", (email,))
+
 
+def _cookie_header(cookies: Dict[str, str]) -> Dict[str, str]:
+    return {"Cookie": "; ".join(f"{name}={value}" for name, value in cookies.items())}
 
-def invalidate_session():
-    global SESSION_COOKIES
-    SESSION_COOKIES = None
 
+def _set_service_session(session: Dict[str, Any] | None):
+    global SESSION_COOKIES, _service_session
+    _service_session = session
+    SESSION_COOKIES = session["cookies"] if session else None
 
-def login_to_erp() -> requests.Session:
-    """Service-account login. Cached globally; used for read-only ERP calls."""
-    global SESSION_COOKIES
 
-    session = requests.Session()
+def _service_session_age() -> float:
+    if _service_session is None:
+        return float("inf")
+    return time.time() - _service_session["created_at"]
 
+
+async def invalidate_session(rejected_headers: Optional[Dict[str, str]] = None):
+    """
+    Drop the service session after ERP rejected it.
+    Rejections of a session that has already been replaced are ignored, so
+    a burst of 403s from the same expired session causes a single login.
+    """
+    if SESSION_COOKIES is None:
+        return
+    if rejected_headers is not None and rejected_headers != _cookie_header(SESSION_COOKIES):
+        return
+    stale = _service_session
+    _set_service_session(None)
+    ERP_SESSION_REFRESHES.inc("rejected")
+    # Only drop the shared session if no other worker has replaced it yet
+    await shared_state.delete(SHARED_SESSION_NAMESPACE, SHARED_SESSION_KEY, if_value=stale)
+
+
+async def login_to_erp() -> Dict[str, str]:
+    """Service-account login. Cached globally and shared between workers;
+    returns auth headers for read-only ERP calls."""
     if SESSION_COOKIES:
-        session.cookies.update(SESSION_COOKIES)
-        return session
+        return _cookie_header(SESSION_COOKIES)
 
-    response = session.post(
-        f"{API_BASE}/api/method/login",
+    async with _login_lock:
+        if SESSION_COOKIES is None:
+            _set_service_session(await shared_state.get_or_refresh(
+                SHARED_SESSION_NAMESPACE, SHARED_SESSION_KEY, _login, ttl=ERP_SESSION_MAX_AGE
+            ))
+    return _cookie_header(SESSION_COOKIES)
+
+
+async def _login(_previous=None) -> Dict[str, Any]:
+    response = await erp_client.request(
+        "POST",
+        "/api/method/login",
         json={"usr": ERP_USER, "pwd": ERP_PASS},
-        headers=_ERP_JSON_HEADER,
-        timeout=10,
     )
 
     if response.status_code != 200:
+        ERP_LOGINS.inc("failure")
         raise HTTPException(status_code=response.status_code, detail="ERP login failed")
 
-    SESSION_COOKIES = session.cookies.get_dict()
-    return session
+    ERP_LOGINS.inc("success")
+    return {"cookies": dict(response.cookies), "created_at": time.time()}
 
 
-def _build_token_session(api_key: str, api_secret: str) -> requests.Session:
-    session = requests.Session()
-    session.headers["Authorization"] = f"Token {api_key}:{api_secret}"
-    return session
+async def refresh_service_session(reason: str):
+    """
+    Replace the service session with a new login.
+    The current session stays in use until the new one is ready, and if
+    another worker has already replaced it, its session is adopted instead.
+    """
+    async with _login_lock:
+        current = _service_session
+
+        async def newer_shared_session():
+            shared = await shared_state.get(SHARED_SESSION_NAMESPACE, SHARED_SESSION_KEY)
+            if shared is not None and shared.fresh and (
+                current is None or shared.value["cookies"] != current["cookies"]
+            ):
+                return shared.value
+            return None
+
+        async def produce():
+            newer = await newer_shared_session()
+            if newer is not None:
+                return newer
+            session = await _login()
+            await shared_state.set(SHARED_SESSION_NAMESPACE, SHARED_SESSION_KEY, session, ttl=ERP_SESSION_MAX_AGE)
+            ERP_SESSION_REFRESHES.inc(reason)
+            return session
+
+        _set_service_session(await shared_state.run_once(
+            f"{SHARED_SESSION_NAMESPACE}:{SHARED_SESSION_KEY}", produce, newer_shared_session
+        ))
+
+
+async def check_service_session():
+    """
+    Make sure the service session exists, is not too old and is still accepted.
+    The check request also keeps ERP's sliding session expiry from running out.
+    """
+    if SESSION_COOKIES is None:
+        await login_to_erp()
+        return
+    if _service_session_age() >= ERP_SESSION_MAX_AGE:
+        await refresh_service_session("max_age")
+        return
+    response = await erp_client.request(
+        "GET", SESSION_CHECK_ENDPOINT, headers_fn=login_to_erp,
+    )
+    if response.status_code in (401, 403):
+        await refresh_service_session("keepalive_rejected")
 
 
-def get_user_erp_session(email: str) -> requests.Session:
-    """Return a per-user ERP session authenticated via Token auth.
+class ServiceSessionKeeper:
+    """
+    Background task that logs the service account in ahead of user requests
+    and keeps its session fresh, so requests never wait for authentication.
+    """
+
+    def __init__(self, interval: float = ERP_SESSION_KEEPALIVE_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            try:
+                await check_service_session()
+            except Exception as e:
+                print(f"[ERP] Service session check failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+service_session_keeper = ServiceSessionKeeper()
+
+
+async def erp_service_request(method: str, path: str, **kwargs):
+    """Send an ERP request as the service account, re-logging in once on 403."""
+    return await erp_client.request(
+        method,
+        path,
+        headers_fn=login_to_erp,
+        invalidate_fn=invalidate_session,
+        **kwargs,
+    )
+
+
+def _build_token_headers(api_key: str, api_secret: str) -> Dict[str, str]:
+    return {"Authorization": f"Token {api_key}:{api_secret}"}
+
+
+async def get_user_erp_session(email: str) -> Dict[str, str]:
+    """Return per-user ERP auth headers (Token auth).
 
     Checks the in-memory cache first, then the local DB, then provisions
     fresh credentials via the ERP admin account.
     """
-    if email in _user_sessions:
-        return _user_sessions[email]
+    headers = _user_sessions.get(email)
+    if headers is not None:
+        return headers
+
+    task = _provisioning.get(email)
+    if task is None:
+        task = asyncio.ensure_future(_load_or_provision(email))
+        _provisioning[email] = task
+        task.add_done_callback(lambda t: _provisioning.pop(email, None))
+    return await asyncio.shield(task)
+
 
+async def _load_or_provision(email: str) -> Dict[str, str]:
     # Try credentials persisted in the local DB from a previous provisioning
-    stored = _load_stored_credentials(email)
-    if stored:
-        api_key, api_secret = stored
-        session = _build_token_session(api_key, api_secret)
-        _user_sessions[email] = session
-        return session
-
-    # Provision new credentials via the service account
-    admin = login_to_erp()
-
-    gen_resp = admin.post(
-        f"{API_BASE}/api/method/frappe.core.doctype.user.user.generate_keys",
+    headers = await _load_stored_headers(email)
+    if headers is not None:
+        return headers
+
+    # Provision new credentials via the service account. Generating keys
+    # replaces the user's secret, so only one worker may do it at a time.
+    return await shared_state.run_once(
+        f"user_credentials:{email}",
+        lambda: _provision(email),
+        lambda: _load_stored_headers(email),
+    )
+
+
+async def _load_stored_headers(email: str) -> Optional[Dict[str, str]]:
+    stored = await _load_stored_credentials(email)
+    if not stored:
+        return None
+    headers = _build_token_headers(*stored)
+    _user_sessions.put(email, headers)
+    return headers
+
+
+async def _provision(email: str) -> Dict[str, str]:
+    # Another worker may have provisioned while we waited for the lease
+    headers = await _load_stored_headers(email)
+    if headers is not None:
+        return headers
+
+    gen_resp = await erp_service_request(
+        "POST",
+        "/api/method/frappe.core.doctype.user.user.generate_keys",
         json={"user": email},
-        headers=_ERP_JSON_HEADER,
-        timeout=10,
     )
     if gen_resp.status_code != 200:
+        ERP_USER_PROVISIONS.inc("failure")
         raise HTTPException(
             status_code=401,
             detail=f"ERP could not generate token for {email}: {gen_resp.text[:200]}",
@@ -117,11 +372,7 @@ def get_user_erp_session(email: str) -> requests.Session:
     api_secret = gen_resp.json().get("message", {}).get("api_secret")
 
     # Fetch the stable api_key from the User document
-    user_resp = admin.get(
-        f"{API_BASE}/api/resource/User/{email}",
-        headers=_ERP_JSON_HEADER,
-        timeout=10,
-    )
+    user_resp = await erp_service_request("GET", f"/api/resource/User/{email}")
     if user_resp.status_code != 200:
         raise HTTPException(status_code=401, detail=f"ERP user not found: {email}")
     api_key = user_resp.json().get("data", {}).get("api_key")
@@ -132,23 +383,21 @@ def get_user_erp_session(email: str) -> requests.Session:
             detail=f"Failed to obtain ERP API credentials for {email}",
         )
 
-    _store_credentials(email, api_key, api_secret)
-    session = _build_token_session(api_key, api_secret)
-    _user_sessions[email] = session
-    return session
+    ERP_USER_PROVISIONS.inc("success")
+    await _store_credentials(email, api_key, api_secret)
+    headers = _build_token_headers(api_key, api_secret)
+    _user_sessions.put(email, headers)
+    return headers
 
 
-def invalidate_user_session(email: str):
-    _user_sessions.pop(email, None)
-    with sqlite3.connect(_DB_PATH) as conn:
-        conn.execute("DELETE FROM user_erp_credentials WHERE email = ?", (email,))
+async def invalidate_user_session(email: str, rejected_headers: Optional[Dict[str, str]] = None):
+    current = _user_sessions.peek(email)
+    if rejected_headers is not None and current is not None and current != rejected_headers:
+        return  # already replaced
+    stale_headers = _user_sessions.pop(email)
+    await local_db.run(_delete_credentials, email, rejected_headers or stale_headers)
 
 
-def user_exists_in_erp(email: str) -> bool:
-    admin = login_to_erp()
-    resp = admin.get(
-        f"{API_BASE}/api/resource/User/{email}",
-        headers=_ERP_JSON_HEADER,
-        timeout=10,
-    )
+async def user_exists_in_erp(email: str) -> bool:
+    resp = await erp_service_request("GET", f"/api/resource/User/{email}")
     return resp.status_code == 200
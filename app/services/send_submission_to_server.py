@@ -1,15 +1,12 @@
 from fastapi import HTTPException
 from typing import Dict, Any
-import requests
+import httpx
 from pydantic import BaseModel
-import os
 import json
-from typing import Dict, Any
-from dotenv import load_dotenv
+from .erp_client import erp_client
+from utils.request_timing import span
 from .login import login_to_erp, invalidate_session, get_user_erp_session, invalidate_user_session
 
-load_dotenv()
-
 
 class SubmissionItem(BaseModel):
     id: str
@@ -19,17 +16,11 @@ class SubmissionItem(BaseModel):
     status: str  # 'pending' | 'submitted' | 'failed'
     is_submittable: int
 
-API_BASE = os.getenv("API_BASE")
-SUBMISSION_ENDPOINT = f'{API_BASE}/api/resource/'
-
-ERP_HEADERS = {
-    'Content-Type': 'application/json',
-    'Accept': 'application/json',
-    'Expect': '',
-}
+SUBMISSION_ENDPOINT = '/api/resource/'
+SUBMISSION_TIMEOUT = 30
 
 
-def _extract_erp_error(response: requests.Response) -> str | None:
+def _extract_erp_error(response: httpx.Response) -> str | None:
     """Extract a clean user-facing error message from a Frappe error response."""
     try:
         body = response.json()
@@ -53,16 +44,16 @@ def _extract_erp_error(response: requests.Response) -> str | None:
         return None
 
 
-def _erp_post_with_retry(session_fn, invalidate_fn, url: str, *, json_body=None, timeout=30) -> requests.Response:
+async def _erp_post_with_retry(session_fn, invalidate_fn, url: str, *, json_body=None, timeout=SUBMISSION_TIMEOUT) -> httpx.Response:
     """POST to ERP, retrying once on 403 with a fresh session."""
-    for attempt in range(2):
-        session = session_fn()
-        response = session.post(url, json=json_body, headers=ERP_HEADERS, timeout=timeout)
-        if response.status_code == 403 and attempt == 0:
-            invalidate_fn()
-            continue
-        return response
-    return response  # unreachable but satisfies type checkers
+    return await erp_client.request(
+        "POST",
+        url,
+        headers_fn=session_fn,
+        invalidate_fn=invalidate_fn,
+        json=json_body,
+        timeout=timeout,
+    )
 
 
 async def send_submission_to_server(
@@ -76,9 +67,10 @@ async def send_submission_to_server(
 
     if user_email:
         try:
-            get_user_erp_session(user_email)  # warm cache; raises on ERP permission/user issues
+            with span("erp_session"):
+                await get_user_erp_session(user_email)  # warm cache; raises on ERP permission/user issues
             session_fn = lambda: get_user_erp_session(user_email)
-            invalidate_fn = lambda: invalidate_user_session(user_email)
+            invalidate_fn = lambda rejected: invalidate_user_session(user_email, rejected)
         except Exception as e:
             print(f"[ERP] Per-user session failed for {user_email}: {e}. Falling back to service account.")
             session_fn = login_to_erp
@@ -88,12 +80,13 @@ async def send_submission_to_server(
         invalidate_fn = invalidate_session
 
     try:
-        create_response = _erp_post_with_retry(
-            session_fn,
-            invalidate_fn,
-            f"{SUBMISSION_ENDPOINT}{form_name}",
-            json_body=data,
-        )
+        with span("erp_create"):
+            create_response = await _erp_post_with_retry(
+                session_fn,
+                invalidate_fn,
+                f"{SUBMISSION_ENDPOINT}{form_name}",
+                json_body=data,
+            )
 
         if create_response.status_code != 200:
             erp_error = _extract_erp_error(create_response)
@@ -111,11 +104,12 @@ async def send_submission_to_server(
             return create_response.json()
 
         doc_name = create_response.json().get("data", {}).get("name")
-        submit_response = _erp_post_with_retry(
-            session_fn,
-            invalidate_fn,
-            f"{SUBMISSION_ENDPOINT}{form_name}/{doc_name}?run_method=submit",
-        )
+        with span("erp_submit"):
+            submit_response = await _erp_post_with_retry(
+                session_fn,
+                invalidate_fn,
+                f"{SUBMISSION_ENDPOINT}{form_name}/{doc_name}?run_method=submit",
+            )
 
         if submit_response.status_code != 200:
             erp_error = _extract_erp_error(submit_response)
@@ -131,7 +125,7 @@ async def send_submission_to_server(
 
         return submit_response.json()
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Network error during submission: {e}")
         raise HTTPException(
             status_code=500,
@@ -0,0 +1,252 @@
+"""
+State shared between worker processes on one host.
+
+When uvicorn runs several workers, each keeps its own in-process caches.
+This module lets them share the service-account session, DocType schemas
+and link option datasets through the local SQLite database (WAL mode),
+and makes sure only one worker at a time refreshes a given entry: the
+others wait for its result instead of calling ERP themselves.
+
+The backend is chosen with SHARED_STATE_BACKEND: "sqlite" (default) or
+"memory" (process-local, for single-worker deployments).
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from utils.settings import load_settings
+from .local_db import local_db
+
+load_settings()
+
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "sqlite").lower()
+# A refresh holding a lease longer than this is assumed dead and taken over
+SHARED_STATE_LEASE_TTL = float(os.getenv("SHARED_STATE_LEASE_TTL", "60"))
+SHARED_STATE_POLL_INTERVAL = float(os.getenv("SHARED_STATE_POLL_INTERVAL", "0.05"))
+# Expired entries are kept this long (for revalidation) before being purged
+SHARED_STATE_MAX_STALE = float(os.getenv("SHARED_STATE_MAX_STALE", "86400"))
+
+
+class SharedEntry:
+    __slots__ = ("value", "expires_at")
+
+    def __init__(self, value: Any, expires_at: float):
+        self.value = value
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires_at > time.time()
+
+
+class MemoryBackend:
+    """
+    Process-local backend with the same semantics as the SQLite one.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], SharedEntry] = {}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    async def get(self, namespace: str, key: str) -> Optional[SharedEntry]:
+        return self._entries.get((namespace, key))
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float):
+        self._entries[(namespace, key)] = SharedEntry(value, time.time() + ttl)
+
+    async def delete(self, namespace: str, key: str, if_value: Any = None):
+        entry = self._entries.get((namespace, key))
+        if entry is not None and (if_value is None or entry.value == if_value):
+            del self._entries[(namespace, key)]
+
+    async def try_acquire(self, name: str, owner: str, ttl: float) -> bool:
+        lease = self._leases.get(name)
+        if lease is not None and lease[1] > time.time():
+            return False
+        self._leases[name] = (owner, time.time() + ttl)
+        return True
+
+    async def release(self, name: str, owner: str):
+        lease = self._leases.get(name)
+        if lease is not None and lease[0] == owner:
+            del self._leases[name]
+
+
+def _init_db(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS shared_state (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS shared_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+
+
+# JSON (de)serialization runs inside these helpers, i.e. on the database
+# thread, so large values don't block the event loop.
+
+def _select_entry(conn, namespace: str, key: str):
+    row = conn.execute(
+        "SELECT value, expires_at FROM shared_state WHERE namespace = ? AND key = ?",
+        (namespace, key),
+    ).fetchone()
+    return SharedEntry(json.loads(row["value"]), row["expires_at"]) if row else None
+
+
+def _upsert_entry(conn, namespace: str, key: str, value: Any, ttl: float, max_stale: float):
+    now = time.time()
+    conn.execute(
+        "INSERT OR REPLACE INTO shared_state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+        (namespace, key, json.dumps(value), now + ttl),
+    )
+    conn.execute("DELETE FROM shared_state WHERE expires_at < ?", (now - max_stale,))
+
+
+def _delete_entry(conn, namespace: str, key: str, if_value: Any):
+    if if_value is None:
+        conn.execute("DELETE FROM shared_state WHERE namespace = ? AND key = ?", (namespace, key))
+    else:
+        conn.execute(
+            "DELETE FROM shared_state WHERE namespace = ? AND key = ? AND value = ?",
+            (namespace, key, json.dumps(if_value)),
+        )
+
+
+def _acquire_lease(conn, name: str, owner: str, ttl: float) -> bool:
+    now = time.time()
+    return conn.execute(
+        """
+        INSERT INTO shared_leases (name, owner, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+        WHERE shared_leases.expires_at < ?
+        """,
+        (name, owner, now + ttl, now),
+    ).rowcount == 1
+
+
+def _release_lease(conn, name: str, owner: str):
+    conn.execute("DELETE FROM shared_leases WHERE name = ? AND owner = ?", (name, owner))
+
+
+class SqliteBackend:
+    """
+    Backend on the local SQLite database; every worker on the host opens
+    the same file, and WAL mode lets them read while one writes.
+    """
+
+    def __init__(self, max_stale: float = SHARED_STATE_MAX_STALE):
+        self.max_stale = max_stale
+        local_db.register_schema(_init_db)
+
+    async def get(self, namespace: str, key: str) -> Optional[SharedEntry]:
+        return await local_db.run(_select_entry, namespace, key)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float):
+        await local_db.run(_upsert_entry, namespace, key, value, ttl, self.max_stale)
+
+    async def delete(self, namespace: str, key: str, if_value: Any = None):
+        await local_db.run(_delete_entry, namespace, key, if_value)
+
+    async def try_acquire(self, name: str, owner: str, ttl: float) -> bool:
+        return await local_db.run(_acquire_lease, name, owner, ttl)
+
+    async def release(self, name: str, owner: str):
+        await local_db.run(_release_lease, name, owner)
+
+
+class SharedState:
+    """
+    Shared key/value entries with a single refresher per entry across workers.
+    """
+
+    def __init__(self, backend, lease_ttl: float = SHARED_STATE_LEASE_TTL,
+                 poll_interval: float = SHARED_STATE_POLL_INTERVAL):
+        self.backend = backend
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.stats = {"shared_hits": 0, "refreshes": 0, "waited": 0}
+
+    async def get(self, namespace: str, key: str) -> Optional[SharedEntry]:
+        return await self.backend.get(namespace, key)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: float):
+        await self.backend.set(namespace, key, value, ttl)
+
+    async def delete(self, namespace: str, key: str, if_value: Any = None):
+        """Delete an entry; with if_value, only if it still holds that value."""
+        await self.backend.delete(namespace, key, if_value)
+
+    async def run_once(self, name: str, produce: Callable[[], Awaitable[Any]],
+                       poll: Callable[[], Awaitable[Optional[Any]]]) -> Any:
+        """
+        Run produce() in at most one worker at a time.
+        While another worker holds the lease, poll() is retried until it
+        returns a result or the lease is released or expires.
+        """
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        waited = False
+        while True:
+            if await self.backend.try_acquire(name, owner, self.lease_ttl):
+                try:
+                    return await produce()
+                finally:
+                    await self.backend.release(name, owner)
+            if not waited:
+                waited = True
+                self.stats["waited"] += 1
+            await asyncio.sleep(self.poll_interval)
+            result = await poll()
+            if result is not None:
+                return result
+
+    async def get_or_refresh(self, namespace: str, key: str,
+                             loader: Callable[[Optional[Any]], Awaitable[Any]], ttl: float) -> Any:
+        """
+        Return the shared value if fresh, otherwise refresh it in one worker.
+        loader receives the expired value (or None) so it can revalidate
+        rather than reload.
+        """
+        entry = await self.backend.get(namespace, key)
+        if entry is not None and entry.fresh:
+            self.stats["shared_hits"] += 1
+            return entry.value
+        previous = entry.value if entry is not None else None
+
+        async def fresh_value():
+            current = await self.backend.get(namespace, key)
+            return current.value if current is not None and current.fresh else None
+
+        async def produce():
+            # Another worker may have finished a refresh just before we got the lease
+            current = await fresh_value()
+            if current is not None:
+                self.stats["shared_hits"] += 1
+                return current
+            self.stats["refreshes"] += 1
+            value = await loader(previous)
+            await self.backend.set(namespace, key, value, ttl)
+            return value
+
+        return await self.run_once(f"{namespace}:{key}", produce, fresh_value)
+
+
+def _create_backend():
+    if SHARED_STATE_BACKEND == "memory":
+        return MemoryBackend()
+    if SHARED_STATE_BACKEND != "sqlite":
+        print(f"Warning: unknown SHARED_STATE_BACKEND '{SHARED_STATE_BACKEND}', using sqlite.")
+    return SqliteBackend()
+
+
+shared_state = SharedState(_create_backend())
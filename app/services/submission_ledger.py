@@ -0,0 +1,88 @@
+"""
+Idempotency ledger for form submissions.
+
+Maps submission ids to their ERP outcome for a bounded time. A duplicate
+id that arrives while the first submission is still in flight waits for
+that result; one that arrives afterwards gets the stored response back
+without calling ERP again.
+
+This is a per-process fast path. Ids accepted on the async path or by
+other worker processes are caught by the submission outbox, which
+records every accepted id.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from utils.settings import load_settings
+
+load_settings()
+
+SUBMISSION_LEDGER_MAX_ENTRIES = int(os.getenv("SUBMISSION_LEDGER_MAX_ENTRIES", "10000"))
+SUBMISSION_LEDGER_TTL = float(os.getenv("SUBMISSION_LEDGER_TTL", "86400"))
+
+
+class SubmissionLedger:
+    """
+    Bounded, TTL-limited record of submission outcomes keyed by submission id.
+    Only successful outcomes are stored, so failed submissions can be retried.
+    """
+
+    def __init__(self, max_entries: int = SUBMISSION_LEDGER_MAX_ENTRIES, ttl: float = SUBMISSION_LEDGER_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # key -> (result, expires_at)
+        self._done: "OrderedDict[Hashable, tuple[Any, float]]" = OrderedDict()
+        self.stats = {"executed": 0, "joined_inflight": 0, "replayed": 0}
+
+    def _get_done(self, key: Hashable):
+        entry = self._done.get(key)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if expires_at < time.monotonic():
+            self._done.pop(key, None)
+            return None
+        return result
+
+    def _store(self, key: Hashable, result: Any):
+        self._done[key] = (result, time.monotonic() + self.ttl)
+        self._done.move_to_end(key)
+        while len(self._done) > self.max_entries:
+            self._done.popitem(last=False)
+
+    def _on_done(self, key: Hashable, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is None:
+            self._store(key, task.result())
+
+    async def run(self, key: Hashable, submit: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """
+        Run submit() at most once per key.
+        Returns (result, replayed) where replayed is True if the result came
+        from an earlier or concurrent submission with the same key.
+        """
+        result = self._get_done(key)
+        if result is not None:
+            self.stats["replayed"] += 1
+            return result, True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["joined_inflight"] += 1
+            return await asyncio.shield(task), True
+
+        # Run as its own task so the ERP write completes (and is recorded)
+        # even if the client that started it disconnects.
+        self.stats["executed"] += 1
+        task = asyncio.ensure_future(submit())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._on_done(key, t))
+        return await asyncio.shield(task), False
+
+
+submission_ledger = SubmissionLedger()
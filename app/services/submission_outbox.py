@@ -0,0 +1,358 @@
+"""
+Durable SQLite-backed outbox for asynchronous form submissions.
+
+Submissions are written to the local database and acknowledged right
+away; a pool of background workers delivers them to ERP, retrying
+transient failures with exponential backoff and recording the final ERP
+response so clients can poll for the outcome.
+
+Synchronous submissions claim a row here too, so the table is the record
+of every accepted submission id across both paths and all worker
+processes: an id is delivered to ERP at most once unless it failed.
+"""
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+from fastapi import HTTPException
+from utils.settings import load_settings
+from .local_db import local_db
+from .send_submission_to_server import send_submission_to_server
+
+load_settings()
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "300"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+# A delivery not finished within this many seconds is assumed lost (e.g. crashed worker)
+OUTBOX_DELIVERY_TIMEOUT = float(os.getenv("OUTBOX_DELIVERY_TIMEOUT", "300"))
+# Submitted and failed rows are kept this long for status polls, then deleted
+OUTBOX_RETENTION = float(os.getenv("OUTBOX_RETENTION", str(7 * 86400)))
+OUTBOX_SWEEP_INTERVAL = float(os.getenv("OUTBOX_SWEEP_INTERVAL", "3600"))
+
+STATUS_QUEUED = "queued"
+STATUS_DELIVERING = "delivering"
+STATUS_SUBMITTED = "submitted"
+STATUS_FAILED = "failed"
+
+
+def _init_db(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS submission_outbox (
+            id TEXT PRIMARY KEY,
+            form_name TEXT NOT NULL,
+            is_submittable INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            user_email TEXT,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            response TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_submission_outbox_due
+        ON submission_outbox (status, next_attempt_at)
+    """)
+
+local_db.register_schema(_init_db)
+
+
+def _is_retryable(status_code: int) -> bool:
+    """ERP validation errors are permanent; timeouts, 429s and 5xx are worth retrying."""
+    return status_code == 429 or status_code >= 500
+
+
+def _insert_submission(conn, submission_id: str, form_name: str, is_submittable: int,
+                       data: Dict[str, Any], user_email: str | None):
+    now = time.time()
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO submission_outbox
+            (id, form_name, is_submittable, data, user_email, status,
+             attempts, next_attempt_at, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)
+        """,
+        (submission_id, form_name, is_submittable, json.dumps(data),
+         user_email, STATUS_QUEUED, now, now, now),
+    )
+    return _select_submission(conn, submission_id)
+
+
+def _claim_submission(conn, submission_id: str, form_name: str, is_submittable: int,
+                      data: Dict[str, Any], user_email: str | None):
+    """
+    Reserve an id for immediate delivery: insert it as delivering, or take
+    over a failed row of the same user. Returns (row, claimed).
+    """
+    now = time.time()
+    claimed = conn.execute(
+        """
+        INSERT INTO submission_outbox
+            (id, form_name, is_submittable, data, user_email, status,
+             attempts, next_attempt_at, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            form_name = excluded.form_name, is_submittable = excluded.is_submittable,
+            data = excluded.data, status = excluded.status,
+            attempts = submission_outbox.attempts + 1, last_error = NULL, updated_at = excluded.updated_at
+        WHERE submission_outbox.status = ? AND submission_outbox.user_email IS excluded.user_email
+        """,
+        (submission_id, form_name, is_submittable, json.dumps(data),
+         user_email, STATUS_DELIVERING, now, now, now, STATUS_FAILED),
+    ).rowcount == 1
+    return _select_submission(conn, submission_id), claimed
+
+
+def _select_submission(conn, submission_id: str):
+    return conn.execute(
+        "SELECT * FROM submission_outbox WHERE id = ?", (submission_id,)
+    ).fetchone()
+
+
+def _claim_next(conn, delivery_timeout: float) -> Optional[sqlite3.Row]:
+    """
+    Atomically move the next due submission to delivering.
+    Deliveries abandoned by a crashed worker are picked up again once
+    they exceed the delivery timeout.
+    """
+    now = time.time()
+    while True:
+        row = conn.execute(
+            """
+            SELECT * FROM submission_outbox
+            WHERE (status = ? AND next_attempt_at <= ?)
+               OR (status = ? AND updated_at <= ?)
+            ORDER BY next_attempt_at LIMIT 1
+            """,
+            (STATUS_QUEUED, now, STATUS_DELIVERING, now - delivery_timeout),
+        ).fetchone()
+        if row is None:
+            return None
+        claimed = conn.execute(
+            """
+            UPDATE submission_outbox
+            SET status = ?, attempts = attempts + 1, updated_at = ?
+            WHERE id = ? AND status = ? AND updated_at = ?
+            """,
+            (STATUS_DELIVERING, now, row["id"], row["status"], row["updated_at"]),
+        ).rowcount
+        if claimed:
+            return row
+
+
+def _next_due_at(conn) -> Optional[float]:
+    (next_due,) = conn.execute(
+        "SELECT MIN(next_attempt_at) FROM submission_outbox WHERE status = ?",
+        (STATUS_QUEUED,),
+    ).fetchone()
+    return next_due
+
+
+def _delete_finished(conn, retention: float) -> int:
+    return conn.execute(
+        "DELETE FROM submission_outbox WHERE status IN (?, ?) AND updated_at < ?",
+        (STATUS_SUBMITTED, STATUS_FAILED, time.time() - retention),
+    ).rowcount
+
+
+def _update_submission(conn, submission_id: str, status: str, response: Any,
+                       error: Any, next_attempt_at: float | None):
+    conn.execute(
+        """
+        UPDATE submission_outbox
+        SET status = ?, response = ?, last_error = ?,
+            next_attempt_at = COALESCE(?, next_attempt_at), updated_at = ?
+        WHERE id = ?
+        """,
+        (status,
+         json.dumps(response) if response is not None else None,
+         json.dumps(error) if error is not None else None,
+         next_attempt_at, time.time(), submission_id),
+    )
+
+
+def _row_to_status(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "submission_id": row["id"],
+        "form_name": row["form_name"],
+        "status": row["status"],
+        "attempts": row["attempts"],
+        "last_error": json.loads(row["last_error"]) if row["last_error"] else None,
+        "server_response": json.loads(row["response"]) if row["response"] else None,
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def _is_owner(row: sqlite3.Row, user_email: str | None) -> bool:
+    return row["user_email"] == user_email
+
+
+def _check_owner(row: sqlite3.Row, user_email: str | None):
+    if not _is_owner(row, user_email):
+        raise HTTPException(
+            status_code=409,
+            detail={
+                'success': False,
+                'error': 'Submission id conflict',
+                'message': 'This submission id is already in use. Generate a new id and resubmit.',
+                'submission_id': row["id"],
+            }
+        )
+
+
+class SubmissionOutbox:
+    """
+    Queue of pending ERP submissions with background delivery workers.
+    """
+
+    def __init__(self, workers: int = OUTBOX_WORKERS, max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 backoff_base: float = OUTBOX_BACKOFF_BASE, backoff_max: float = OUTBOX_BACKOFF_MAX,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 delivery_timeout: float = OUTBOX_DELIVERY_TIMEOUT,
+                 retention: float = OUTBOX_RETENTION, sweep_interval: float = OUTBOX_SWEEP_INTERVAL):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.delivery_timeout = delivery_timeout
+        self.retention = retention
+        self.sweep_interval = sweep_interval
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def enqueue(self, submission_id: str, form_name: str, is_submittable: int,
+                      data: Dict[str, Any], user_email: str | None = None) -> Dict[str, Any]:
+        """
+        Persist a submission for background delivery.
+        Re-enqueueing an existing id returns its current status unchanged;
+        an id already used by another user is rejected with a 409.
+        """
+        row = await local_db.run(
+            _insert_submission, submission_id, form_name, is_submittable, data, user_email
+        )
+        _check_owner(row, user_email)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return _row_to_status(row)
+
+    async def claim(self, submission_id: str, form_name: str, is_submittable: int,
+                    data: Dict[str, Any], user_email: str | None = None) -> tuple[Dict[str, Any], bool]:
+        """
+        Reserve an id for synchronous delivery by the caller.
+        Returns (status, claimed); when not claimed the id was already
+        accepted (queued, delivering or submitted) and must not be sent again.
+        The caller reports the outcome with record_result().
+        """
+        row, claimed = await local_db.run(
+            _claim_submission, submission_id, form_name, is_submittable, data, user_email
+        )
+        _check_owner(row, user_email)
+        return _row_to_status(row), claimed
+
+    async def record_result(self, submission_id: str, *, response: Any = None, error: Any = None):
+        """Record the outcome of a claimed synchronous delivery."""
+        status = STATUS_FAILED if error is not None else STATUS_SUBMITTED
+        await self._finish(submission_id, status, response=response, error=error)
+
+    async def get_status(self, submission_id: str, user_email: str | None = None) -> Optional[Dict[str, Any]]:
+        row = await local_db.run(_select_submission, submission_id)
+        if row is None:
+            return None
+        # Don't leak other users' submissions
+        if not _is_owner(row, user_email):
+            return None
+        return _row_to_status(row)
+
+    async def _next_due_in(self) -> float:
+        """Seconds until the next queued submission is due, capped at the poll interval."""
+        next_due = await local_db.run(_next_due_at)
+        if next_due is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(0.0, next_due - time.time()))
+
+    async def _finish(self, submission_id: str, status: str, *, response: Any = None,
+                      error: Any = None, next_attempt_at: float | None = None):
+        await local_db.run(_update_submission, submission_id, status, response, error, next_attempt_at)
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return delay + random.uniform(0, delay * 0.1)
+
+    async def _deliver(self, row: sqlite3.Row):
+        attempts = row["attempts"] + 1
+        try:
+            response = await send_submission_to_server(
+                row["form_name"],
+                row["is_submittable"],
+                json.loads(row["data"]),
+                user_email=row["user_email"],
+            )
+        except HTTPException as e:
+            status_code, error = e.status_code, e.detail
+        except Exception as e:
+            status_code, error = 500, {"success": False, "error": str(e)}
+        else:
+            await self._finish(row["id"], STATUS_SUBMITTED, response=response)
+            return
+
+        if _is_retryable(status_code) and attempts < self.max_attempts:
+            delay = self._backoff(attempts)
+            print(f"[Outbox] Delivery of {row['id']} failed ({status_code}), retrying in {delay:.1f}s")
+            await self._finish(row["id"], STATUS_QUEUED, error=error, next_attempt_at=time.time() + delay)
+        else:
+            print(f"[Outbox] Delivery of {row['id']} failed permanently ({status_code})")
+            await self._finish(row["id"], STATUS_FAILED, error=error)
+
+    async def _worker(self):
+        while True:
+            # Cleared before claiming so an enqueue racing the claim still wakes us
+            self._wakeup.clear()
+            row = await local_db.run(_claim_next, self.delivery_timeout)
+            if row is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=await self._next_due_in())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._deliver(row)
+            except Exception as e:
+                # Never let one bad row kill the worker
+                print(f"[Outbox] Unexpected error delivering {row['id']}: {e}")
+                await self._finish(row["id"], STATUS_QUEUED, error={"error": str(e)},
+                                   next_attempt_at=time.time() + self._backoff(row["attempts"] + 1))
+
+    async def _sweeper(self):
+        while True:
+            try:
+                deleted = await local_db.run(_delete_finished, self.retention)
+                if deleted:
+                    print(f"[Outbox] Deleted {deleted} finished submissions older than {self.retention:.0f}s")
+            except Exception as e:
+                print(f"[Outbox] Retention sweep failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweeper()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+submission_outbox = SubmissionOutbox()
@@ -0,0 +1,213 @@
+"""
+Local pre-validation of submission data against the cached DocType schema.
+
+Catches the mistakes ERP would reject anyway (missing required fields,
+values of the wrong type, unknown Select options, malformed child table
+rows, Link values that don't exist) before any ERP call is made, and
+reports them per field.
+
+Checks are deliberately conservative: anything Frappe might accept
+(numeric strings and fractions in Int fields, dates in formats its parser
+reads, objects in JSON fields, fields with defaults or conditional
+mandatory rules, keys not in the schema) is left for ERP to decide. That includes required
+fields the server fills itself: `fetch_from` and read-only fields, and
+Links to DocTypes that usually come from user or global defaults.
+"""
+import asyncio
+import os
+from typing import Any, Dict, List, Optional
+from fastapi import HTTPException
+from utils.settings import load_settings
+from .doctype_cache import get_cached_doctype
+from .create_schema_hash import LAYOUT_FIELD_TYPES
+from .link_index import link_index, LINK_INDEX_ENABLED
+
+load_settings()
+
+SUBMIT_PREVALIDATION_ENABLED = os.getenv("SUBMIT_PREVALIDATION_ENABLED", "true").lower() in ("1", "true", "yes")
+
+INT_FIELD_TYPES = {"Int", "Long Int"}
+FLOAT_FIELD_TYPES = {"Float", "Currency", "Percent", "Rating", "Duration"}
+TABLE_FIELD_TYPES = {"Table", "Table MultiSelect"}
+# Field types whose values may be objects or arrays
+STRUCTURED_FIELD_TYPES = {"JSON", "Geolocation"}
+# Field types that hold no data of their own
+NO_VALUE_FIELD_TYPES = LAYOUT_FIELD_TYPES | {"Tab Break", "Button", "Heading", "Image", "Fold"}
+# Link targets Frappe commonly fills from session defaults when left empty
+SESSION_DEFAULT_DOCTYPES = {
+    name.strip() for name in os.getenv(
+        "SUBMIT_SESSION_DEFAULT_DOCTYPES", "Company,Currency,Fiscal Year,Price List,Warehouse,Cost Center"
+    ).split(",") if name.strip()
+}
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == []
+
+
+def _is_number(value: Any) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    if isinstance(value, str):
+        try:
+            float(value)
+            return True
+        except ValueError:
+            return False
+    return False
+
+
+def _could_be_temporal(value: Any) -> bool:
+    # Frappe parses dates and times leniently (dateutil), so only values
+    # no parser could read as one are rejected here
+    return isinstance(value, str) and any(c.isdigit() for c in value)
+
+
+def _type_error(fieldtype: str, value: Any) -> Optional[str]:
+    """Return a message if value can't be a value of fieldtype."""
+    if fieldtype in STRUCTURED_FIELD_TYPES:
+        return None
+    if fieldtype in INT_FIELD_TYPES or fieldtype in FLOAT_FIELD_TYPES:
+        # Frappe's cint truncates fractions, so any number is a valid Int
+        return None if _is_number(value) else "must be a number"
+    if fieldtype == "Check":
+        return None if value in (0, 1, "0", "1") else "must be 0 or 1"
+    if fieldtype == "Date":
+        return None if _could_be_temporal(value) else "must be a date (YYYY-MM-DD)"
+    if fieldtype == "Datetime":
+        return None if _could_be_temporal(value) else "must be a date and time (YYYY-MM-DD HH:MM:SS)"
+    if fieldtype == "Time":
+        return None if _could_be_temporal(value) else "must be a time (HH:MM:SS)"
+    if fieldtype in TABLE_FIELD_TYPES:
+        if not isinstance(value, list) or not all(isinstance(row, dict) for row in value):
+            return "must be a list of rows"
+        return None
+    # Text-like types (Data, Link, Select, Text Editor, ...) are stored as strings
+    if isinstance(value, (dict, list)):
+        return "must be a single value"
+    return None
+
+
+def _select_options(field: Dict[str, Any]) -> List[str]:
+    return [line.strip() for line in str(field.get("options") or "").splitlines() if line.strip()]
+
+
+def _client_must_fill(field: Dict[str, Any]) -> bool:
+    """Whether an empty reqd field would fail in ERP rather than be filled in there."""
+    if field.get("default") or field.get("mandatory_depends_on") or field.get("depends_on"):
+        return False
+    if field.get("fetch_from") or field.get("read_only"):
+        return False
+    if field.get("fieldtype") == "Link" and field.get("options") in SESSION_DEFAULT_DOCTYPES:
+        return False
+    return True
+
+
+def _error(fieldname: str, code: str, message: str, **extra) -> Dict[str, Any]:
+    return {"field": fieldname, "code": code, "message": message, **extra}
+
+
+def validate_document(schema: Dict[str, Any], data: Dict[str, Any],
+                      child_schemas: Dict[str, Dict[str, Any]], links: Optional[list] = None,
+                      **location) -> List[Dict[str, Any]]:
+    """
+    Validate one document (or child row) against its schema.
+    location (table, row) is added to every error of a child row.
+    Link values are appended to links (if given) as (field, value, location)
+    for the membership check.
+    """
+    errors: List[Dict[str, Any]] = []
+    for field in schema.get("fields", []):
+        fieldtype = field.get("fieldtype", "")
+        fieldname = field.get("fieldname")
+        if not fieldname or fieldtype in NO_VALUE_FIELD_TYPES:
+            continue
+        label = field.get("label") or fieldname
+        value = data.get(fieldname)
+
+        if _is_empty(value):
+            if field.get("reqd") and _client_must_fill(field):
+                errors.append(_error(fieldname, "required", f"{label} is required", **location))
+            continue
+
+        message = _type_error(fieldtype, value)
+        if message:
+            errors.append(_error(fieldname, "invalid_type", f"{label} {message}", fieldtype=fieldtype, **location))
+            continue
+
+        if fieldtype == "Select":
+            options = _select_options(field)
+            if options and str(value) not in options:
+                errors.append(_error(
+                    fieldname, "invalid_option", f"{label} must be one of: {', '.join(options)}",
+                    options=options, **location,
+                ))
+
+        elif fieldtype == "Link" and links is not None and field.get("options"):
+            links.append((field, str(value), location))
+
+        elif fieldtype in TABLE_FIELD_TYPES and not location:
+            child_schema = child_schemas.get(field.get("options"))
+            if child_schema is None:
+                continue
+            for idx, row in enumerate(value, start=1):
+                errors.extend(validate_document(child_schema, row, child_schemas, links, table=fieldname, row=idx))
+    return errors
+
+
+async def _load_child_schemas(schema: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Child table schemas by DocType; ones that fail to load are left to ERP."""
+    names = list(dict.fromkeys(
+        f.get("options") for f in schema.get("fields", [])
+        if f.get("fieldtype") in TABLE_FIELD_TYPES and f.get("options")
+    ))
+    results = await asyncio.gather(*(get_cached_doctype(name) for name in names), return_exceptions=True)
+    return {name: result for name, result in zip(names, results) if not isinstance(result, Exception)}
+
+
+async def _check_links(links: list) -> List[Dict[str, Any]]:
+    """Errors for Link values that aren't existing records; unloadable indexes are left to ERP."""
+    values_by_doctype: Dict[str, set] = {}
+    for field, value, _ in links:
+        values_by_doctype.setdefault(field["options"], set()).add(value)
+    doctypes = list(values_by_doctype)
+    results = await asyncio.gather(
+        *(link_index.find_missing(doctype, values_by_doctype[doctype]) for doctype in doctypes),
+        return_exceptions=True,
+    )
+    missing = {
+        doctype: result for doctype, result in zip(doctypes, results) if not isinstance(result, Exception)
+    }
+    errors = []
+    for field, value, location in links:
+        doctype = field["options"]
+        if value in missing.get(doctype, ()):
+            label = field.get("label") or field["fieldname"]
+            errors.append(_error(
+                field["fieldname"], "invalid_link", f"{label}: {doctype} '{value}' does not exist",
+                doctype=doctype, value=value, **location,
+            ))
+    return errors
+
+
+async def validate_submission(form_name: str, schema: Dict[str, Any], data: Dict[str, Any]):
+    """Raise a field-level 422 if data can't pass ERP validation for this schema."""
+    if not SUBMIT_PREVALIDATION_ENABLED:
+        return
+    child_schemas = await _load_child_schemas(schema)
+    links = [] if LINK_INDEX_ENABLED else None
+    errors = validate_document(schema, data, child_schemas, links)
+    if links:
+        errors += await _check_links(links)
+    if errors:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                'success': False,
+                'error': 'Validation failed',
+                'message': f"{len(errors)} field(s) of {form_name} failed validation",
+                'fields': errors,
+            }
+        )
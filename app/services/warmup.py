@@ -0,0 +1,155 @@
+"""
+Startup warm-up.
+
+Run from the app lifespan before the first request is served: opens the
+local database, logs the service account in to ERP and prefetches the
+schemas, Link-field options and Link membership indexes of the configured
+forms in parallel, so the first users after a cold start don't pay for
+cold ERP fetches.
+Prefetching is bounded by a time budget; anything still loading when it
+runs out keeps going in the background.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional
+from utils.settings import load_settings
+from .local_db import local_db
+from .login import login_to_erp
+from .form_bundle import build_form_bundle
+from .link_index import link_index, LINK_INDEX_ENABLED
+
+load_settings()
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+# Comma-separated DocType names of the forms the ERP systems serve
+WARMUP_FORMS = [f.strip() for f in os.getenv("WARMUP_FORMS", "").split(",") if f.strip()]
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "20"))
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_COMPLETE = "complete"
+STATUS_PARTIAL = "partial"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+
+
+class Warmup:
+    """
+    Tracks the warm-up run so /health can report it.
+    """
+
+    def __init__(self, forms: Optional[List[str]] = None, timeout: float = WARMUP_TIMEOUT,
+                 enabled: bool = WARMUP_ENABLED):
+        self.forms = WARMUP_FORMS if forms is None else forms
+        self.timeout = timeout
+        self.enabled = enabled
+        self.status = STATUS_PENDING
+        self.timings_ms: Dict[str, float] = {}
+        self.forms_status: Dict[str, str] = {}
+        self.errors: Dict[str, str] = {}
+        self._pending: List[asyncio.Task] = []
+
+    async def _prefetch(self, form_name: str):
+        bundle = await build_form_bundle(form_name)
+        for target, error in bundle["errors"].items():
+            self.errors[f"{form_name}:{target}"] = str(error.get("detail"))
+        partial = bool(bundle["errors"])
+        if LINK_INDEX_ENABLED:
+            # Submit validation checks Link values against these indexes
+            targets = list(bundle["link_options"])
+            results = await asyncio.gather(*(link_index.warm(t) for t in targets), return_exceptions=True)
+            for target, result in zip(targets, results):
+                if isinstance(result, Exception):
+                    self.errors[f"{form_name}:{target}:link_index"] = str(result)
+                    partial = True
+        self.forms_status[form_name] = "partial" if partial else "ready"
+
+    def _on_prefetch_done(self, form_name: str, task: asyncio.Task):
+        if task.cancelled():
+            self.forms_status[form_name] = "cancelled"
+        elif task.exception() is not None:
+            self.forms_status[form_name] = "failed"
+            self.errors[form_name] = str(task.exception())
+        elif self.status == STATUS_PARTIAL and not self.errors and all(
+            s == "ready" for s in self.forms_status.values()
+        ):
+            # A form that outran the budget finished in the background
+            self.status = STATUS_COMPLETE
+
+    async def run(self, process_started: Optional[float] = None):
+        """
+        Warm up within the time budget. process_started (a perf_counter value
+        taken at import) lets the report include import time.
+        """
+        started = time.perf_counter()
+        if process_started is not None:
+            self.timings_ms["imports"] = (started - process_started) * 1000
+
+        # Tables are created here rather than at import
+        await local_db.init()
+        self.timings_ms["local_db"] = (time.perf_counter() - started) * 1000
+
+        if not self.enabled:
+            self.status = STATUS_SKIPPED
+            self._report(started, process_started)
+            return
+
+        self.status = STATUS_RUNNING
+        step = time.perf_counter()
+        try:
+            await asyncio.wait_for(login_to_erp(), timeout=self.timeout)
+        except Exception as e:
+            self.errors["login"] = str(e) or type(e).__name__
+            self.status = STATUS_FAILED
+            self._report(started, process_started)
+            return
+        self.timings_ms["login"] = (time.perf_counter() - step) * 1000
+
+        step = time.perf_counter()
+        remaining = max(0.0, self.timeout - (step - started))
+        tasks = []
+        for form_name in self.forms:
+            self.forms_status[form_name] = "loading"
+            task = asyncio.ensure_future(self._prefetch(form_name))
+            task.add_done_callback(lambda t, name=form_name: self._on_prefetch_done(name, t))
+            tasks.append(task)
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=remaining)
+            # Slow forms keep loading in the background and fill the caches later
+            self._pending = list(pending)
+        self.timings_ms["prefetch"] = (time.perf_counter() - step) * 1000
+
+        failed = self.errors or any(s != "ready" for s in self.forms_status.values())
+        self.status = STATUS_PARTIAL if failed else STATUS_COMPLETE
+        self._report(started, process_started)
+
+    def _report(self, started: float, process_started: Optional[float]):
+        self.timings_ms["warmup"] = (time.perf_counter() - started) * 1000
+        if process_started is not None:
+            self.timings_ms["cold_start"] = (time.perf_counter() - process_started) * 1000
+        summary = ", ".join(f"{name}={ms:.0f}ms" for name, ms in self.timings_ms.items())
+        print(f"[Warmup] {self.status}: {summary}; forms={self.forms_status or '-'}")
+
+    @property
+    def ready(self) -> bool:
+        return self.status in (STATUS_COMPLETE, STATUS_SKIPPED)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "finished": self.status not in (STATUS_PENDING, STATUS_RUNNING),
+            "ready": self.ready,
+            "timings_ms": {name: round(ms, 1) for name, ms in self.timings_ms.items()},
+            "forms": self.forms_status,
+            "errors": self.errors,
+        }
+
+    async def stop(self):
+        for task in self._pending:
+            task.cancel()
+        await asyncio.gather(*self._pending, return_exceptions=True)
+        self._pending = []
+
+
+warmup = Warmup()
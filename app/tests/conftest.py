@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Keep the local database out of the working tree and cross-process state in memory
+os.environ.setdefault("LOCAL_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="erp-tests-"), "local.db"))
+os.environ.setdefault("SHARED_STATE_BACKEND", "memory")
@@ -0,0 +1,130 @@
+import asyncio
+import gzip
+import zlib
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from middleware.compression_middleware import CompressionMiddleware
+from utils.http_cache import etag_matches
+
+LARGE = "x" * 4096
+ETAG = '"0123456789abcdef0123456789abcdef"'
+
+
+def call(app, headers=(), method="GET"):
+    """Run one request through the middleware; returns (start message, body messages)."""
+    scope = {
+        "type": "http", "method": method, "path": "/",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+    }
+    messages = []
+    requests = [{"type": "http.request", "body": b""}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        # The client stays connected
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(CompressionMiddleware(app, minimum_size=1024)(scope, receive, send))
+    start = messages[0]
+    return {k.decode(): v.decode() for k, v in start["headers"]} | {"status": start["status"]}, messages[1:]
+
+
+def body_of(messages) -> bytes:
+    return b"".join(m.get("body", b"") for m in messages)
+
+
+def test_large_body_is_compressed_with_vary_and_encoded_etag():
+    headers, body = call(PlainTextResponse(LARGE, headers={"ETag": ETAG}), [("Accept-Encoding", "gzip")])
+
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert headers["etag"] == ETAG[:-1] + '-gzip"'
+    assert gzip.decompress(body_of(body)).decode() == LARGE
+    assert int(headers["content-length"]) == len(body_of(body))
+
+
+def test_small_body_is_sent_as_is_with_vary():
+    headers, body = call(PlainTextResponse("small", headers={"ETag": ETAG}), [("Accept-Encoding", "gzip")])
+
+    assert "content-encoding" not in headers
+    assert headers["vary"] == "Accept-Encoding"
+    assert headers["etag"] == ETAG
+    assert body_of(body) == b"small"
+
+
+def test_identity_client_gets_vary():
+    headers, body = call(PlainTextResponse(LARGE))
+
+    assert "content-encoding" not in headers
+    assert headers["vary"] == "Accept-Encoding"
+    assert body_of(body).decode() == LARGE
+
+
+def test_existing_vary_is_kept():
+    response = PlainTextResponse(LARGE, headers={"Vary": "Origin"})
+    headers, _ = call(response, [("Accept-Encoding", "gzip")])
+
+    assert headers["vary"] == "Origin, Accept-Encoding"
+
+
+def test_not_modified_echoes_the_encoded_etag():
+    response = PlainTextResponse("", status_code=304, headers={"ETag": ETAG})
+    headers, _ = call(response, [("Accept-Encoding", "gzip"), ("If-None-Match", ETAG[:-1] + '-gzip"')])
+
+    assert headers["etag"] == ETAG[:-1] + '-gzip"'
+    assert headers["vary"] == "Accept-Encoding"
+
+
+def test_encoded_etag_matches_identity_etag():
+    request = Request({"type": "http", "headers": [(b"if-none-match", (ETAG[:-1] + '-gzip"').encode())]})
+
+    assert etag_matches(request, ETAG)
+
+
+def test_stream_is_compressed_from_the_first_chunk():
+    async def records():
+        yield b'{"name": "A"}\n'
+        yield b'{"name": "B"}\n'
+
+    headers, messages = call(
+        StreamingResponse(records(), media_type="application/x-ndjson"), [("Accept-Encoding", "gzip")]
+    )
+
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    # Each record is flushed on its own, long before minimum_size bytes
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(messages[0]["body"]) == b'{"name": "A"}\n'
+    assert decompressor.decompress(messages[1]["body"]) == b'{"name": "B"}\n'
+    assert decompressor.decompress(body_of(messages[2:])) == b""
+    assert decompressor.eof
+
+
+def test_already_encoded_response_is_left_alone():
+    response = PlainTextResponse(LARGE, headers={"Content-Encoding": "identity"})
+    headers, body = call(response, [("Accept-Encoding", "gzip")])
+
+    assert headers["content-encoding"] == "identity"
+    assert body_of(body).decode() == LARGE
+
+
+def test_json_response_round_trips():
+    data = {"data": [{"name": f"V{i:05d}"} for i in range(200)]}
+    headers, body = call(JSONResponse(data), [("Accept-Encoding", "br;q=0, gzip")])
+
+    assert headers["content-encoding"] == "gzip"
+    assert gzip.decompress(body_of(body)).startswith(b'{"data":[{"name":"V00000"}')
+
+
+def test_head_response_is_not_encoded():
+    headers, _ = call(PlainTextResponse(LARGE), [("Accept-Encoding", "gzip")], method="HEAD")
+
+    assert "content-encoding" not in headers
+    assert headers["content-length"] == str(len(LARGE))
+    assert headers["vary"] == "Accept-Encoding"
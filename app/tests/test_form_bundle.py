@@ -0,0 +1,54 @@
+import asyncio
+
+from fastapi import HTTPException
+
+from services import form_bundle
+from services.form_bundle import build_form_bundle
+
+SCHEMAS = {
+    "Farmer": {"name": "Farmer", "fields": [
+        {"fieldname": "village", "fieldtype": "Link", "options": "Village"},
+        {"fieldname": "crops", "fieldtype": "Table", "options": "Farmer Crop"},
+        {"fieldname": "tags", "fieldtype": "Table MultiSelect", "options": "Farmer Tag"},
+    ]},
+    "Farmer Crop": {"name": "Farmer Crop", "fields": [
+        {"fieldname": "crop", "fieldtype": "Link", "options": "Crop"},
+        {"fieldname": "village", "fieldtype": "Link", "options": "Village"},
+    ]},
+}
+
+
+def setup(monkeypatch):
+    requested = []
+
+    async def get_cached_doctype(name):
+        if name not in SCHEMAS:
+            raise HTTPException(status_code=404, detail=f"{name} not found")
+        return SCHEMAS[name]
+
+    async def get_options(target):
+        requested.append(target)
+        return [{"name": f"{target} 1"}]
+
+    monkeypatch.setattr(form_bundle, "get_cached_doctype", get_cached_doctype)
+    monkeypatch.setattr(form_bundle.link_options_cache, "get_options", get_options)
+    return requested
+
+
+def test_bundle_includes_child_table_links(monkeypatch):
+    requested = setup(monkeypatch)
+
+    bundle = asyncio.run(build_form_bundle("Farmer"))
+
+    assert list(bundle["child_doctypes"]) == ["Farmer Crop"]
+    assert set(bundle["link_options"]) == {"Village", "Crop"}
+    # Village is linked from the form and its child table but loaded once
+    assert sorted(requested) == ["Crop", "Village"]
+
+
+def test_unloadable_child_table_is_reported(monkeypatch):
+    setup(monkeypatch)
+
+    bundle = asyncio.run(build_form_bundle("Farmer"))
+
+    assert bundle["errors"] == {"Farmer Tag": {"status_code": 404, "detail": "Farmer Tag not found"}}
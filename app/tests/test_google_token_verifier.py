@@ -0,0 +1,179 @@
+import asyncio
+import base64
+import json
+import time
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+from utils.google_token_verifier import GoogleTokenVerifier, TokenValidationError
+
+CLIENT_ID = "test-client.apps.googleusercontent.com"
+
+
+def b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def int_b64url(value: int) -> str:
+    return b64url(value.to_bytes((value.bit_length() + 7) // 8, "big"))
+
+
+class KeyEndpoint:
+    """Stand-in for Google's JWKS endpoint, serving local key pairs."""
+
+    def __init__(self):
+        self.keys = {}
+        self.requests = 0
+
+    def add_key(self, kid: str):
+        self.keys[kid] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        return self.keys[kid]
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        jwks = []
+        for kid, key in self.keys.items():
+            numbers = key.public_key().public_numbers()
+            jwks.append({"kty": "RSA", "alg": "RS256", "use": "sig", "kid": kid,
+                         "n": int_b64url(numbers.n), "e": int_b64url(numbers.e)})
+        return httpx.Response(200, json={"keys": jwks})
+
+
+def encode(header, claims) -> str:
+    return f"{b64url(json.dumps(header).encode())}.{b64url(json.dumps(claims).encode())}"
+
+
+def sign(key, kid: str, **overrides) -> str:
+    now = int(time.time())
+    claims = {
+        "iss": "https://accounts.google.com",
+        "aud": CLIENT_ID,
+        "sub": "1234",
+        "email": "user@example.com",
+        "email_verified": True,
+        "iat": now,
+        "exp": now + 3600,
+        **overrides,
+    }
+    signing_input = encode({"alg": "RS256", "kid": kid, "typ": "JWT"}, claims)
+    signature = key.sign(signing_input.encode("ascii"), padding.PKCS1v15(), hashes.SHA256())
+    return f"{signing_input}.{b64url(signature)}"
+
+
+@pytest.fixture
+def endpoint():
+    return KeyEndpoint()
+
+
+def make_verifier(endpoint, audiences=(CLIENT_ID,), **kwargs):
+    return GoogleTokenVerifier(
+        jwks_url="https://keys.test/certs",
+        audiences=list(audiences),
+        transport=httpx.MockTransport(endpoint.handler),
+        **kwargs,
+    )
+
+
+def verify(verifier, token):
+    return asyncio.run(verifier.verify(token))
+
+
+def test_valid_token_returns_user_info(endpoint):
+    key = endpoint.add_key("k1")
+    verifier = make_verifier(endpoint)
+
+    user = verify(verifier, sign(key, "k1"))
+
+    assert user["user_id"] == "1234"
+    assert user["email"] == "user@example.com"
+    assert user["audience"] == CLIENT_ID
+    assert 0 < user["expires_in"] <= 3600
+
+
+def test_validated_token_is_cached(endpoint):
+    key = endpoint.add_key("k1")
+    verifier = make_verifier(endpoint)
+    token = sign(key, "k1")
+
+    verify(verifier, token)
+    verify(verifier, token)
+
+    assert verifier.stats == {"hits": 1, "misses": 1}
+    assert endpoint.requests == 1
+
+
+def test_unknown_kid_refreshes_keys(endpoint):
+    endpoint.add_key("k1")
+    verifier = make_verifier(endpoint, min_refresh_interval=0)
+    verify(verifier, sign(endpoint.keys["k1"], "k1"))
+
+    rotated = endpoint.add_key("k2")
+    user = verify(verifier, sign(rotated, "k2"))
+
+    assert user["user_id"] == "1234"
+    assert endpoint.requests == 2
+
+
+def test_unknown_kid_refresh_is_rate_limited(endpoint):
+    key = endpoint.add_key("k1")
+    verifier = make_verifier(endpoint, min_refresh_interval=60)
+    verify(verifier, sign(key, "k1"))
+
+    for _ in range(3):
+        with pytest.raises(TokenValidationError):
+            verify(verifier, sign(key, "unknown"))
+
+    assert endpoint.requests == 1
+
+
+@pytest.mark.parametrize("overrides", [
+    {"aud": "someone-else.apps.googleusercontent.com"},
+    {"iss": "https://evil.example.com"},
+    {"exp": int(time.time()) - 3600},
+    {"iat": int(time.time()) + 3600},
+    {"exp": "never"},
+])
+def test_invalid_claims_are_rejected(endpoint, overrides):
+    key = endpoint.add_key("k1")
+    verifier = make_verifier(endpoint)
+
+    with pytest.raises(TokenValidationError):
+        verify(verifier, sign(key, "k1", **overrides))
+
+
+def test_signature_from_another_key_is_rejected(endpoint):
+    endpoint.add_key("k1")
+    forger = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    verifier = make_verifier(endpoint)
+
+    with pytest.raises(TokenValidationError, match="signature"):
+        verify(verifier, sign(forger, "k1"))
+
+
+def test_missing_client_ids_rejects_every_token(endpoint):
+    key = endpoint.add_key("k1")
+    verifier = make_verifier(endpoint, audiences=())
+
+    with pytest.raises(TokenValidationError):
+        verify(verifier, sign(key, "k1"))
+    assert endpoint.requests == 0
+
+
+@pytest.mark.parametrize("token", [
+    "not-a-jwt",
+    "a.b.c.d",
+    "!!!.???.###",
+    encode({"alg": "RS256", "kid": "k1"}, ["a", "list"]) + ".c2ln",
+    encode(["a", "list"], {"sub": "1"}) + ".c2ln",
+    encode({"alg": "RS256", "kid": ["k1"]}, {"sub": "1"}) + ".c2ln",
+    encode({"alg": "none", "kid": "k1"}, {"sub": "1"}) + ".",
+])
+def test_malformed_tokens_raise_validation_error(endpoint, token):
+    endpoint.add_key("k1")
+    verifier = make_verifier(endpoint)
+
+    with pytest.raises(TokenValidationError):
+        verify(verifier, token)
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from services import link_index as link_index_module
+from services.link_index import LinkIndex, LinkIndexRegistry, _build_members
+
+
+@pytest.mark.parametrize("bloom_threshold", [10, 0], ids=["set", "bloom"])
+def test_membership_ignores_case(bloom_threshold):
+    index = LinkIndex("Customer", _build_members(["Acme Corp", "Globex"], bloom_threshold), "2025-01-01")
+
+    assert "acme corp" in index
+    assert "GLOBEX" in index
+    assert "Initech" not in index
+
+
+def test_delta_applies_case_insensitively():
+    index = LinkIndex("Customer", _build_members(["Acme Corp", "Globex"], 10), "2025-01-01")
+
+    index.apply_delta({"data": [{"name": "Initech"}], "deleted": ["acme corp"], "watermark": "2025-01-02"})
+
+    assert "initech" in index
+    assert "Acme Corp" not in index
+    assert "Globex" in index
+
+
+def test_failed_build_is_not_retried_until_the_failure_ttl(monkeypatch):
+    calls = []
+
+    async def fetch_all_link_rows(doctype, fields=None):
+        calls.append(doctype)
+        raise HTTPException(status_code=403, detail="Not permitted")
+
+    monkeypatch.setattr(link_index_module, "fetch_all_link_rows", fetch_all_link_rows)
+
+    async def lookups(registry, doctype):
+        for _ in range(3):
+            with pytest.raises(HTTPException):
+                await registry.find_missing(doctype, ["X"])
+
+    cached = LinkIndexRegistry(failure_ttl=60)
+    asyncio.run(lookups(cached, "Forbidden A"))
+    assert calls == ["Forbidden A"]
+    assert cached.stats["negative_hits"] == 2
+
+    calls.clear()
+    asyncio.run(lookups(LinkIndexRegistry(failure_ttl=0), "Forbidden B"))
+    assert calls == ["Forbidden B"] * 3
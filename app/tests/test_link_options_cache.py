@@ -0,0 +1,47 @@
+import asyncio
+
+from services import link_options_cache as link_options_cache_module
+from services.link_options_cache import LinkOptionsCache, LinkOptionsEntry
+
+ROWS = [
+    {"name": "T-1", "territory": "North"},
+    {"name": "T-2", "territory": "north"},
+    {"name": "T-3", "territory": "South"},
+]
+
+
+def test_filter_value_matches_case_insensitively():
+    entry = LinkOptionsEntry(ROWS, "territory")
+
+    assert [o["name"] for o in entry.lookup("NORTH")] == ["T-1", "T-2"]
+    assert [o["name"] for o in entry.lookup("south")] == ["T-3"]
+    assert entry.lookup("East") == []
+
+
+def test_no_filter_value_returns_every_option():
+    entry = LinkOptionsEntry(ROWS, "territory")
+
+    assert entry.lookup(None) == [{"name": "T-1"}, {"name": "T-2"}, {"name": "T-3"}]
+
+
+def test_field_order_shares_one_dataset(monkeypatch):
+    loads = []
+
+    async def fetch_all_link_rows(doctype, fields=None):
+        loads.append(fields)
+        return [{"name": "T-1", "label": "One", "territory": "North"}]
+
+    monkeypatch.setattr(link_options_cache_module, "fetch_all_link_rows", fetch_all_link_rows)
+    cache = LinkOptionsCache()
+
+    async def run():
+        first = await cache.get_options("Territory", fields=["name", "label"])
+        second = await cache.get_options("Territory", fields=["label", "name"])
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert len(loads) == 1
+    assert cache.snapshot()["entries"] == 1
+    assert list(first[0]) == ["name", "label"]
+    assert list(second[0]) == ["label", "name"]
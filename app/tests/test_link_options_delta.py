@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from bench.fake_frappe import create_fake_frappe
+from services import fetch_link_options
+from services.fetch_link_options import fetch_link_options_delta, normalize_since
+
+
+@pytest.fixture
+def erp(monkeypatch):
+    """Route ERP reads to the bench fake; on_request(n) runs before the n-th request."""
+    fake = create_fake_frappe(villages=10, districts=2, extra_doctypes=0, seed=1)
+    state = {"requests": 0, "on_request": None}
+
+    async def request(method, path, params=None, **kwargs):
+        state["requests"] += 1
+        if state["on_request"] is not None:
+            state["on_request"](state["requests"])
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=fake), base_url="http://erp") as client:
+            return await client.request(method, path, params=params)
+
+    monkeypatch.setattr(fetch_link_options, "erp_service_request", request)
+    monkeypatch.setattr(fetch_link_options, "LINK_OPTIONS_PAGE_SIZE", 3)
+    return fake, state
+
+
+def test_delta_returns_every_changed_row(erp):
+    fake, _ = erp
+    delta = asyncio.run(fetch_link_options_delta("Village", "2024-12-31"))
+
+    assert sorted(r["name"] for r in delta["data"]) == sorted(r["name"] for r in fake.state.docs["Village"])
+    assert delta["watermark"] == "2025-01-10 00:00:00"
+
+
+def test_row_modified_mid_scan_does_not_hide_others(erp):
+    fake, state = erp
+    villages = fake.state.docs["Village"]
+
+    def touch_first_row(request_number):
+        # After the first page, the earliest row is edited and moves to the end
+        if request_number == 2:
+            villages[0]["modified"] = "2025-02-01 00:00:00"
+
+    state["on_request"] = touch_first_row
+    delta = asyncio.run(fetch_link_options_delta("Village", "2024-12-31"))
+
+    assert {r["name"] for r in delta["data"]} == {r["name"] for r in villages}
+    assert delta["watermark"] == "2025-02-01 00:00:00"
+
+
+def test_deleted_names_are_paged_by_creation(erp):
+    fake, _ = erp
+    fake.state.docs["Deleted Document"].extend(
+        {"name": f"DD{i}", "deleted_doctype": "Village", "deleted_name": f"V9{i}",
+         "creation": "2025-01-05 00:00:00"}
+        for i in range(7)
+    )
+
+    delta = asyncio.run(fetch_link_options_delta("Village", "2024-12-31"))
+
+    assert sorted(delta["deleted"]) == [f"V9{i}" for i in range(7)]
+
+
+def test_since_without_offset_is_used_as_erp_local_time():
+    assert normalize_since("2024-05-01T10:00:00") == "2024-05-01 10:00:00.000000"
+
+
+def test_since_with_offset_is_rejected_without_erp_time_zone(monkeypatch):
+    monkeypatch.setattr(fetch_link_options, "ERP_TIME_ZONE", "")
+
+    with pytest.raises(HTTPException) as exc:
+        normalize_since("2024-05-01T10:00:00+05:30")
+    assert exc.value.status_code == 400
+
+
+def test_since_with_offset_is_converted_to_erp_time_zone(monkeypatch):
+    monkeypatch.setattr(fetch_link_options, "ERP_TIME_ZONE", "UTC")
+
+    assert normalize_since("2024-05-01T10:00:00+05:30") == "2024-05-01 04:30:00.000000"
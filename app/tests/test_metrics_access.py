@@ -0,0 +1,40 @@
+import asyncio
+
+import httpx
+
+import main
+from services.erp_client import endpoint_label
+
+
+def get_metrics(headers=None):
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/metrics", headers=headers or {})
+    return asyncio.run(run())
+
+
+def test_metrics_disabled_without_token(monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", "")
+
+    assert get_metrics().status_code == 404
+
+
+def test_metrics_require_the_token(monkeypatch):
+    monkeypatch.setattr(main, "METRICS_TOKEN", "s3cret")
+
+    assert get_metrics().status_code == 401
+    assert get_metrics({"Authorization": "Bearer wrong"}).status_code == 401
+    response = get_metrics({"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert "http_requests_in_flight" in response.text
+
+
+def test_unknown_doctypes_share_one_label():
+    known = {"Village"}.__contains__
+
+    assert endpoint_label("/api/resource/Village", known) == "/api/resource/Village"
+    assert endpoint_label("/api/resource/Village/V-1", known) == "/api/resource/Village/:name"
+    assert endpoint_label("/api/resource/Whatever123", known) == "/api/resource/:doctype"
+    assert endpoint_label("/api/resource/Village") == "/api/resource/:doctype"
+    assert endpoint_label("/api/method/frappe.client.get_count", known) == "/api/method/frappe.client.get_count"
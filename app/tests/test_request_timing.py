@@ -0,0 +1,15 @@
+from utils.request_timing import RequestTimings
+
+
+def test_repeated_spans_are_aggregated():
+    timings = RequestTimings()
+    for _ in range(100):
+        timings.add("erp_create", 2.0)
+        timings.add("erp_submit", 1.0)
+    timings.add("doctype", 0.5)
+
+    entries = timings.server_timing().split(", ")
+
+    assert entries[:3] == ['erp_create;dur=200.0;desc="x100"', 'erp_submit;dur=100.0;desc="x100"', "doctype;dur=0.5"]
+    assert entries[3].startswith("total;dur=")
+    assert len(entries) == 4
@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from services import fetch_link_options
+from services.fetch_link_options import decode_cursor, encode_cursor, stream_link_options
+
+NAMES = [f"V{i:03d}" for i in range(7)]
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    """Stand-in ERP listing NAMES in name order; fail_after makes the page after that name fail."""
+    state = {"fail_after": None, "error": None}
+
+    async def fake_fetch(linked_doctype, filter_list, after, page_size, fields=None):
+        if state["error"] is not None and after == state["fail_after"]:
+            raise state["error"]
+        remaining = [n for n in NAMES if after is None or n > after]
+        return [{"name": n} for n in remaining[:page_size]]
+
+    monkeypatch.setattr(fetch_link_options, "_fetch_page_after", fake_fetch)
+    return state
+
+
+def collect(stream):
+    async def read():
+        return b"".join([chunk async for chunk in stream])
+    return [json.loads(line) for line in asyncio.run(read()).decode().splitlines()]
+
+
+def test_streams_every_record(pages):
+    lines = collect(stream_link_options("Village", page_size=3))
+    assert [line["name"] for line in lines] == NAMES
+
+
+def test_resumes_after_cursor(pages):
+    lines = collect(stream_link_options("Village", page_size=3, cursor=encode_cursor("V002")))
+    assert [line["name"] for line in lines] == NAMES[3:]
+
+
+def test_invalid_cursor_fails_before_streaming(pages):
+    with pytest.raises(HTTPException) as exc:
+        stream_link_options("Village", cursor="not-a-cursor")
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("error, status_code", [
+    (httpx.ReadTimeout("timed out"), 502),
+    (HTTPException(status_code=503, detail="ERP unavailable"), 503),
+])
+def test_mid_stream_failure_ends_with_resumable_error_line(pages, error, status_code):
+    pages["fail_after"], pages["error"] = "V002", error
+
+    lines = collect(stream_link_options("Village", page_size=3))
+
+    assert [line["name"] for line in lines[:-1]] == NAMES[:3]
+    assert lines[-1]["status_code"] == status_code
+    assert decode_cursor(lines[-1]["next_cursor"]) == "V002"
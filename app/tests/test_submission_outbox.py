@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from services.local_db import local_db
+from services.submission_outbox import (
+    SubmissionOutbox, STATUS_DELIVERING, STATUS_QUEUED, STATUS_SUBMITTED, _delete_finished,
+)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def outbox():
+    yield SubmissionOutbox(retention=60)
+    local_db.run_sync(lambda conn: conn.execute("DELETE FROM submission_outbox"))
+
+
+def test_reenqueue_by_owner_returns_current_status(outbox):
+    first = run(outbox.enqueue("s1", "Farmer", 0, {"a": 1}, user_email="one@x"))
+    again = run(outbox.enqueue("s1", "Farmer", 0, {"a": 2}, user_email="one@x"))
+
+    assert first["status"] == again["status"] == STATUS_QUEUED
+
+
+def test_id_of_another_user_is_rejected(outbox):
+    run(outbox.enqueue("s1", "Farmer", 0, {"a": 1}, user_email="one@x"))
+
+    with pytest.raises(HTTPException) as exc:
+        run(outbox.enqueue("s1", "Farmer", 0, {"a": 2}, user_email="two@x"))
+
+    assert exc.value.status_code == 409
+    assert run(outbox.get_status("s1", user_email="two@x")) is None
+    assert run(outbox.get_status("s1", user_email="one@x"))["status"] == STATUS_QUEUED
+
+
+def test_retention_sweep_deletes_only_old_finished_rows(outbox):
+    for submission_id in ("old", "recent", "pending"):
+        run(outbox.enqueue(submission_id, "Farmer", 0, {}, user_email="one@x"))
+    run(outbox._finish("old", STATUS_SUBMITTED, response={}))
+    run(outbox._finish("recent", STATUS_SUBMITTED, response={}))
+    local_db.run_sync(lambda conn: conn.execute(
+        "UPDATE submission_outbox SET updated_at = ? WHERE id IN ('old', 'pending')", (time.time() - 120,)
+    ))
+
+    assert local_db.run_sync(_delete_finished, outbox.retention) == 1
+
+    assert run(outbox.get_status("old", user_email="one@x")) is None
+    assert run(outbox.get_status("recent", user_email="one@x")) is not None
+    assert run(outbox.get_status("pending", user_email="one@x")) is not None
+
+
+def test_claim_reserves_id_for_one_delivery(outbox):
+    status, claimed = run(outbox.claim("s1", "Farmer", 0, {"a": 1}, user_email="one@x"))
+    assert claimed and status["status"] == STATUS_DELIVERING
+
+    # Another worker, or an async retry, sees the id as taken
+    _, claimed_again = run(outbox.claim("s1", "Farmer", 0, {"a": 1}, user_email="one@x"))
+    assert not claimed_again
+    assert run(outbox.enqueue("s1", "Farmer", 0, {"a": 1}, user_email="one@x"))["status"] == STATUS_DELIVERING
+
+    run(outbox.record_result("s1", response={"data": {"name": "F1"}}))
+    status, claimed_again = run(outbox.claim("s1", "Farmer", 0, {"a": 1}, user_email="one@x"))
+    assert not claimed_again
+    assert status["status"] == STATUS_SUBMITTED
+    assert status["server_response"] == {"data": {"name": "F1"}}
+
+
+def test_failed_id_can_be_claimed_again_by_its_owner(outbox):
+    run(outbox.claim("s1", "Farmer", 0, {"a": 1}, user_email="one@x"))
+    run(outbox.record_result("s1", error={"error": "ERP down"}))
+
+    with pytest.raises(HTTPException) as exc:
+        run(outbox.claim("s1", "Farmer", 0, {"a": 2}, user_email="two@x"))
+    assert exc.value.status_code == 409
+
+    status, claimed = run(outbox.claim("s1", "Farmer", 0, {"a": 2}, user_email="one@x"))
+    assert claimed
+    assert status["attempts"] == 2
+    assert status["last_error"] is None
+
+
+def test_queued_id_is_not_claimed_for_sync_delivery(outbox):
+    run(outbox.enqueue("s1", "Farmer", 0, {"a": 1}, user_email="one@x"))
+
+    status, claimed = run(outbox.claim("s1", "Farmer", 0, {"a": 1}, user_email="one@x"))
+
+    assert not claimed
+    assert status["status"] == STATUS_QUEUED
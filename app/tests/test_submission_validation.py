@@ -0,0 +1,91 @@
+from services.submission_validation import validate_document
+
+
+def schema(*fields):
+    return {"fields": [{"label": f["fieldname"].title(), **f} for f in fields]}
+
+
+def required_fields(schema, data):
+    return [e["field"] for e in validate_document(schema, data, {}) if e["code"] == "required"]
+
+
+def test_missing_required_field_is_reported():
+    doc = schema({"fieldname": "customer_name", "fieldtype": "Data", "reqd": 1})
+
+    assert required_fields(doc, {}) == ["customer_name"]
+    assert required_fields(doc, {"customer_name": "Acme"}) == []
+
+
+def test_required_fields_filled_by_erp_are_left_to_erp():
+    doc = schema(
+        {"fieldname": "status", "fieldtype": "Select", "reqd": 1, "default": "Draft", "options": "Draft\nOpen"},
+        {"fieldname": "item_name", "fieldtype": "Data", "reqd": 1, "fetch_from": "item_code.item_name"},
+        {"fieldname": "naming_series", "fieldtype": "Data", "reqd": 1, "read_only": 1},
+        {"fieldname": "company", "fieldtype": "Link", "reqd": 1, "options": "Company"},
+        {"fieldname": "currency", "fieldtype": "Link", "reqd": 1, "options": "Currency"},
+        {"fieldname": "due_date", "fieldtype": "Date", "reqd": 1, "mandatory_depends_on": "eval:doc.is_pos"},
+    )
+
+    assert required_fields(doc, {}) == []
+
+
+def test_required_link_without_session_default_is_reported():
+    doc = schema({"fieldname": "customer", "fieldtype": "Link", "reqd": 1, "options": "Customer"})
+
+    assert required_fields(doc, {}) == ["customer"]
+
+
+def type_errors(schema, data):
+    return [e["field"] for e in validate_document(schema, data, {}) if e["code"] == "invalid_type"]
+
+
+def test_js_style_timestamps_are_accepted_for_dates():
+    doc = schema(
+        {"fieldname": "posting_date", "fieldtype": "Date"},
+        {"fieldname": "visited_at", "fieldtype": "Datetime"},
+        {"fieldname": "visit_time", "fieldtype": "Time"},
+    )
+    data = {
+        "posting_date": "2024-05-01T00:00:00.000Z",
+        "visited_at": "2024-05-01T10:15:00.000Z",
+        "visit_time": "10:15",
+    }
+
+    assert type_errors(doc, data) == []
+
+
+def test_values_that_cannot_be_dates_are_reported():
+    doc = schema({"fieldname": "posting_date", "fieldtype": "Date"})
+
+    assert type_errors(doc, {"posting_date": "yesterday"}) == ["posting_date"]
+    assert type_errors(doc, {"posting_date": {"day": 1}}) == ["posting_date"]
+
+
+def test_structured_values_are_accepted_for_json_and_geolocation():
+    doc = schema(
+        {"fieldname": "payload", "fieldtype": "JSON"},
+        {"fieldname": "plot", "fieldtype": "Geolocation"},
+        {"fieldname": "tags", "fieldtype": "JSON"},
+    )
+    data = {
+        "payload": {"source": "mobile"},
+        "plot": {"type": "FeatureCollection", "features": []},
+        "tags": ["a", "b"],
+    }
+
+    assert type_errors(doc, data) == []
+
+
+def test_fractional_values_are_accepted_for_int():
+    doc = schema({"fieldname": "quantity", "fieldtype": "Int"})
+
+    assert type_errors(doc, {"quantity": 1.5}) == []
+    assert type_errors(doc, {"quantity": "1.5"}) == []
+    assert type_errors(doc, {"quantity": "12"}) == []
+    assert type_errors(doc, {"quantity": "twelve"}) == ["quantity"]
+
+
+def test_objects_are_rejected_for_text_fields():
+    doc = schema({"fieldname": "customer_name", "fieldtype": "Data"})
+
+    assert type_errors(doc, {"customer_name": {"first": "A"}}) == ["customer_name"]
@@ -0,0 +1,62 @@
+import asyncio
+from urllib.parse import quote
+
+import httpx
+import pytest
+
+import main
+from bench.fake_frappe import BENCH_FORM, create_fake_frappe
+from bench.fake_token_verifier import FakeTokenVerifier, bench_token
+from middleware.auth_middleware import AuthMiddleware
+from services.erp_client import erp_client
+
+HEADERS = {"Authorization": f"Bearer {bench_token(0)}"}
+
+
+@pytest.fixture
+def fake_erp(monkeypatch):
+    """Serve ERP from the bench fake and accept bench tokens."""
+    fake = create_fake_frappe(villages=20, districts=2, extra_doctypes=0, seed=1)
+    monkeypatch.setattr(erp_client, "base_url", "http://fake-frappe.test")
+    monkeypatch.setattr(erp_client, "transport", httpx.ASGITransport(app=fake))
+    monkeypatch.setattr(erp_client, "_client", None)
+    for middleware in main.app.user_middleware:
+        if middleware.cls is AuthMiddleware:
+            monkeypatch.setitem(middleware.kwargs, "token_verifier", FakeTokenVerifier())
+    # Rebuilt with the fake verifier on the next request, and again afterwards
+    monkeypatch.setattr(main.app, "middleware_stack", None)
+    yield fake
+    main.app.middleware_stack = None
+
+
+def submit(data, submission_id):
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            schema = await client.get(f"/doctype/{quote(BENCH_FORM)}/hash", headers=HEADERS)
+            item = {
+                "id": submission_id,
+                "formName": BENCH_FORM,
+                "data": data,
+                "schemaHash": schema.json()["schema_hash"],
+                "status": "pending",
+                "is_submittable": 1,
+            }
+            return await client.post("/submit", json=item, headers=HEADERS)
+    return asyncio.run(run())
+
+
+def test_unknown_link_value_is_rejected_before_erp(fake_erp):
+    response = submit({"farmer_name": "Asha", "village": "V99999"}, "invalid-link-1")
+
+    assert response.status_code == 422
+    fields = response.json()["detail"]["fields"]
+    assert [(f["field"], f["code"], f["value"]) for f in fields] == [("village", "invalid_link", "V99999")]
+    assert fake_erp.state.stats["created"] == 0
+
+
+def test_link_value_in_other_case_is_accepted(fake_erp):
+    response = submit({"farmer_name": "Asha", "village": "v00001"}, "valid-link-1")
+
+    assert response.status_code == 200
+    assert fake_erp.state.stats["created"] == 1
@@ -0,0 +1,210 @@
+"""
+Local verification of Google ID tokens (RS256 JWTs).
+
+Google's signing keys are fetched from the JWKS endpoint and cached; they
+are refreshed on a schedule or when a token carries an unknown key id.
+Successfully validated tokens are cached in memory until they expire, so
+the hot path does no network I/O at all.
+
+GOOGLE_CLIENT_IDS must list the OAuth client ids tokens may be issued
+for; without it every token is rejected.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import httpx
+from utils.settings import load_settings
+
+load_settings()
+
+GOOGLE_JWKS_URL = os.getenv("GOOGLE_JWKS_URL", "https://www.googleapis.com/oauth2/v3/certs")
+GOOGLE_CLIENT_IDS = [c.strip() for c in os.getenv("GOOGLE_CLIENT_IDS", "").split(",") if c.strip()]
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+GOOGLE_JWKS_REFRESH_INTERVAL = float(os.getenv("GOOGLE_JWKS_REFRESH_INTERVAL", "3600"))
+GOOGLE_JWKS_MIN_REFRESH_INTERVAL = float(os.getenv("GOOGLE_JWKS_MIN_REFRESH_INTERVAL", "60"))
+GOOGLE_TOKEN_LEEWAY = int(os.getenv("GOOGLE_TOKEN_LEEWAY", "30"))
+GOOGLE_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("GOOGLE_TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
+
+class TokenValidationError(Exception):
+    pass
+
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _b64url_to_int(segment: str) -> int:
+    return int.from_bytes(_b64url_decode(segment), "big")
+
+
+class GoogleTokenVerifier:
+    """
+    Verifies Google ID tokens locally against cached signing keys.
+    """
+
+    def __init__(self, jwks_url: str = GOOGLE_JWKS_URL,
+                 audiences: Optional[List[str]] = None,
+                 refresh_interval: float = GOOGLE_JWKS_REFRESH_INTERVAL,
+                 min_refresh_interval: float = GOOGLE_JWKS_MIN_REFRESH_INTERVAL,
+                 leeway: int = GOOGLE_TOKEN_LEEWAY,
+                 max_cached_tokens: int = GOOGLE_TOKEN_CACHE_MAX_ENTRIES,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.jwks_url = jwks_url
+        self.audiences = GOOGLE_CLIENT_IDS if audiences is None else audiences
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.leeway = leeway
+        self.max_cached_tokens = max_cached_tokens
+        self.transport = transport
+        self._keys: Dict[str, Any] = {}
+        self._keys_fetched_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+        # sha256(token) -> (user_info, exp)
+        self._token_cache: "OrderedDict[bytes, tuple[Dict[str, Any], int]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+        if not self.audiences:
+            print("Error: GOOGLE_CLIENT_IDS is not set; all ID tokens will be rejected.")
+
+    async def _refresh_keys(self, force: bool = False):
+        async with self._refresh_lock:
+            age = time.monotonic() - self._keys_fetched_at
+            # Another caller may have refreshed while we waited for the lock,
+            # and unknown key ids must not be able to hammer the JWKS endpoint.
+            if self._keys and age < (self.min_refresh_interval if force else self.refresh_interval):
+                return
+
+            from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicNumbers
+
+            async with httpx.AsyncClient(transport=self.transport) as client:
+                response = await client.get(self.jwks_url, timeout=10.0)
+            response.raise_for_status()
+
+            keys = {}
+            for jwk in response.json().get("keys", []):
+                if jwk.get("kty") != "RSA" or "kid" not in jwk:
+                    continue
+                keys[jwk["kid"]] = RSAPublicNumbers(
+                    _b64url_to_int(jwk["e"]), _b64url_to_int(jwk["n"])
+                ).public_key()
+
+            self._keys = keys
+            self._keys_fetched_at = time.monotonic()
+
+    async def _get_key(self, kid: str):
+        if not self._keys or time.monotonic() - self._keys_fetched_at >= self.refresh_interval:
+            await self._refresh_keys()
+        key = self._keys.get(kid)
+        if key is None:
+            # Google rotates keys; an unknown kid triggers a (rate-limited) refresh
+            await self._refresh_keys(force=True)
+            key = self._keys.get(kid)
+        if key is None:
+            raise TokenValidationError(f"Unknown signing key id: {kid}")
+        return key
+
+    def _check_claims(self, claims: Dict[str, Any]):
+        now = int(time.time())
+        if claims.get("iss") not in GOOGLE_ISSUERS:
+            raise TokenValidationError("Invalid issuer")
+        if claims.get("aud") not in self.audiences:
+            raise TokenValidationError("Invalid audience")
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)) or exp + self.leeway < now:
+            raise TokenValidationError("Token expired")
+        iat = claims.get("iat")
+        if isinstance(iat, (int, float)) and iat - self.leeway > now:
+            raise TokenValidationError("Token issued in the future")
+
+    async def _verify(self, token: str) -> Dict[str, Any]:
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+
+        try:
+            header_b64, payload_b64, signature_b64 = token.split(".")
+            header = json.loads(_b64url_decode(header_b64))
+            claims = json.loads(_b64url_decode(payload_b64))
+            signature = _b64url_decode(signature_b64)
+        except ValueError:
+            raise TokenValidationError("Malformed token")
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise TokenValidationError("Malformed token")
+
+        if header.get("alg") != "RS256":
+            raise TokenValidationError(f"Unsupported algorithm: {header.get('alg')}")
+
+        kid = header.get("kid")
+        if not isinstance(kid, str):
+            raise TokenValidationError("Missing signing key id")
+        key = await self._get_key(kid)
+        try:
+            key.verify(
+                signature,
+                f"{header_b64}.{payload_b64}".encode("ascii"),
+                padding.PKCS1v15(),
+                hashes.SHA256(),
+            )
+        except InvalidSignature:
+            raise TokenValidationError("Invalid signature")
+
+        self._check_claims(claims)
+        return claims
+
+    def _cache_get(self, cache_key: bytes) -> Optional[Dict[str, Any]]:
+        entry = self._token_cache.get(cache_key)
+        if entry is None:
+            return None
+        user_info, exp = entry
+        now = int(time.time())
+        if exp + self.leeway < now:
+            self._token_cache.pop(cache_key, None)
+            return None
+        self._token_cache.move_to_end(cache_key)
+        return {**user_info, "expires_in": max(exp - now, 0)}
+
+    def _cache_put(self, cache_key: bytes, user_info: Dict[str, Any], exp: int):
+        self._token_cache[cache_key] = (user_info, exp)
+        self._token_cache.move_to_end(cache_key)
+        while len(self._token_cache) > self.max_cached_tokens:
+            self._token_cache.popitem(last=False)
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """
+        Verify a Google ID token and return the user info.
+        Raises TokenValidationError if the token is not valid.
+        """
+        if not self.audiences:
+            # Without an audience any Google client's tokens would pass
+            raise TokenValidationError("GOOGLE_CLIENT_IDS is not configured")
+
+        cache_key = hashlib.sha256(token.encode("utf-8")).digest()
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+        self.stats["misses"] += 1
+
+        claims = await self._verify(token)
+        exp = int(claims["exp"])
+        user_info = {
+            "user_id": claims.get("sub"),
+            "email": claims.get("email"),
+            "name": claims.get("name"),
+            "picture": claims.get("picture"),
+            "verified_email": claims.get("email_verified"),
+            "audience": claims.get("aud"),
+            "issued_at": claims.get("iat"),
+        }
+        self._cache_put(cache_key, user_info, exp)
+        return {**user_info, "expires_in": max(exp - int(time.time()), 0)}
+
+
+google_token_verifier = GoogleTokenVerifier()
@@ -0,0 +1,79 @@
+"""
+Helpers for ETag-based conditional responses.
+"""
+import hashlib
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from typing import Any, Optional
+
+# Responses are per-user (auth protected), so only the client may cache them,
+# and it must revalidate with If-None-Match before reuse.
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    """Build a strong ETag from the given version parts."""
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def content_etag(body: bytes) -> str:
+    """Build a strong ETag from a response body digest."""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+# Suffixes CompressionMiddleware adds to the ETag of an encoded representation
+ENCODING_ETAG_SUFFIXES = ("-gzip", "-br")
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """ETag of the content-encoded representation of the response tagged etag."""
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def strip_etag_encoding(etag: str) -> str:
+    """Inverse of encoded_etag: the ETag of the identity representation."""
+    for suffix in ENCODING_ETAG_SUFFIXES:
+        if etag.endswith(f'{suffix}"'):
+            return f'{etag[:-len(suffix) - 1]}"'
+    return etag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check If-None-Match against an ETag.
+    Uses weak comparison, as RFC 9110 requires for If-None-Match, and
+    accepts the tags of compressed representations of the same content.
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [strip_etag_encoding(c.strip().removeprefix("W/")) for c in header.split(",")]
+    return etag in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def conditional_json_response(request: Request, content: Any, etag: Optional[str] = None) -> Response:
+    """
+    Return content as JSON with an ETag, or a 304 if the client already has it.
+    If no ETag is given, one is derived from the rendered body.
+    """
+    if etag is not None and etag_matches(request, etag):
+        return not_modified(etag)
+
+    response = JSONResponse(content)
+    if etag is None:
+        etag = content_etag(response.body)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
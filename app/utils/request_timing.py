@@ -0,0 +1,105 @@
+"""
+Lightweight per-request timing spans.
+
+Code wraps a stage in `with span("name"):`. When a request is being timed
+(see ServerTimingMiddleware) the duration is recorded on it; otherwise
+span() returns a shared no-op, so instrumented code costs one context
+variable lookup when timing is off.
+"""
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from utils.settings import load_settings
+
+load_settings()
+
+REQUEST_TIMING_ENABLED = os.getenv("REQUEST_TIMING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Requests slower than this are written to the slow-request log; 0 disables the log
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+
+
+class RequestTimings:
+    """Spans recorded for one request, in completion order."""
+
+    __slots__ = ("started", "spans")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+
+    def add(self, name: str, duration_ms: float):
+        self.spans.append((name, duration_ms))
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def aggregated(self) -> List[Tuple[str, float, int]]:
+        """(name, summed duration, count) per span name, in order of first completion."""
+        totals: Dict[str, List[float]] = {}
+        for name, duration in self.spans:
+            entry = totals.setdefault(name, [0.0, 0])
+            entry[0] += duration
+            entry[1] += 1
+        return [(name, duration, count) for name, (duration, count) in totals.items()]
+
+    def server_timing(self) -> str:
+        """
+        Render as a Server-Timing header value, with the elapsed time so far as total.
+        Repeated spans (e.g. one per batch item) become one entry with their summed duration.
+        """
+        entries = [
+            f"{name};dur={duration:.1f}" + (f';desc="x{count}"' if count > 1 else "")
+            for name, duration, count in self.aggregated()
+        ]
+        entries.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+class _Span:
+    __slots__ = ("timings", "name", "started")
+
+    def __init__(self, timings: RequestTimings, name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.add(self.name, (time.perf_counter() - self.started) * 1000)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    """Time a block as one stage of the current request."""
+    timings = _current.get()
+    if timings is None:
+        return _NULL_SPAN
+    return _Span(timings, name)
+
+
+def start_request_timing() -> Tuple[RequestTimings, object]:
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request_timing(token: object):
+    _current.reset(token)
@@ -0,0 +1,17 @@
+"""
+Process-wide settings loading.
+
+Modules read their configuration from environment variables at import
+time; load_settings() loads the .env file into the environment the first
+time it is called and is a no-op afterwards.
+"""
+from dotenv import load_dotenv
+
+_loaded = False
+
+
+def load_settings():
+    global _loaded
+    if not _loaded:
+        load_dotenv()
+        _loaded = True